@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Startup benchmark for the latencycalc CLI.
+
+Runs quick commands in fresh interpreters and fails if they take longer than the budget over a
+bare interpreter start, or if importing latencycalc pulls in numpy, scipy, sounddevice or
+pyarrow. Each command is timed both as the installed console script runs it, importing
+latencycalc from its bytecode cache, and as `python latencycalc.py`, which compiles the whole
+module on every run and so grows with it. Run from the repository root:
+
+    python benchmarks/bench_startup.py [--runs 20] [--budget-ms 100]
+"""
+
+import argparse
+import os
+import py_compile
+import statistics
+import subprocess
+import sys
+import time
+
+SRC = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+HEAVY_MODULES = ["numpy", "scipy", "sounddevice", "pyarrow", "sqlite3", "zipfile"]
+SCRIPT = os.path.join(SRC, "latencycalc.py")
+# Import the CLI like the installed console script does
+RUN_CLI = f"import sys; sys.path.insert(0, {SRC!r}); from latencycalc import cli; cli(prog_name='latencycalc')"
+COMMANDS = {"python -c pass": [sys.executable, "-c", "pass"]}
+for args in (["--version"], ["--help"], ["history", "--help"]):
+    COMMANDS[" ".join(["latencycalc", *args])] = [sys.executable, "-c", RUN_CLI, *args]
+    COMMANDS[" ".join(["python latencycalc.py", *args])] = [sys.executable, SCRIPT, *args]
+
+
+def median_ms(command, runs):
+    """Median wall time of a command in ms."""
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times)
+
+
+def heavy_imports():
+    """Return the heavy modules loaded by `import latencycalc`."""
+    probe = f"import sys; import latencycalc; print(' '.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    env = dict(os.environ, PYTHONPATH=SRC)
+    output = subprocess.run([sys.executable, "-c", probe], env=env, capture_output=True, text=True, check=True)
+    return output.stdout.split()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=20, help="Runs per command (default 20)")
+    parser.add_argument("--budget-ms", type=float, default=100.0, help="Allowed startup over bare Python (ms)")
+    args = parser.parse_args()
+
+    # Write the bytecode cache even under PYTHONDONTWRITEBYTECODE, so imports do not time the compiler
+    py_compile.compile(SCRIPT)
+    failed = False
+    loaded = heavy_imports()
+    if loaded:
+        print(f"FAIL: import latencycalc loads {', '.join(loaded)}")
+        failed = True
+
+    baseline = median_ms(COMMANDS["python -c pass"], args.runs)
+    print(f"{'python -c pass':<38} {baseline:7.1f} ms")
+    for name, command in list(COMMANDS.items())[1:]:
+        elapsed = median_ms(command, args.runs)
+        overhead = elapsed - baseline
+        status = "ok" if overhead <= args.budget_ms else "FAIL"
+        failed |= status == "FAIL"
+        print(
+            f"{name:<38} {elapsed:7.1f} ms  (+{overhead:.1f} ms over bare Python, budget {args.budget_ms:g} ms) {status}"
+        )
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,109 +1,1989 @@
+import collections
+import contextlib
 import csv
+import fnmatch
+import functools
+import hashlib
+import importlib
+import importlib.util
+import json
 import os
+import stat
 import sys
+import threading
+import time
 
 import click
-import numpy as np
-import scipy.signal
-import sounddevice as sd
+
+
+class _LazyModule:
+    """Stand-in for a module that is imported on first attribute access.
+
+    Heavy dependencies are only loaded by the commands that use them, which keeps --help,
+    --version and monitoring invocations fast. On first use the proxy replaces itself with the
+    real module in this module's globals, so later lookups cost nothing extra.
+    """
+
+    def __init__(self, name, alias):
+        self._name = name
+        self._alias = alias
+
+    def __getattr__(self, attr):
+        module = importlib.import_module(self._name)
+        globals()[self._alias] = module
+        return getattr(module, attr)
+
+
+np = _LazyModule("numpy", "np")
+sd = _LazyModule("sounddevice", "sd")
+sqlite3 = _LazyModule("sqlite3", "sqlite3")
+zipfile = _LazyModule("zipfile", "zipfile")
+# Optional: Parquet export, check have_module("pyarrow") first
+pa = _LazyModule("pyarrow", "pa")
+pq = _LazyModule("pyarrow.parquet", "pq")
 
 __version__ = "0.1.0"
 
+# Default upper bound for the lag search: no real loopback path takes longer than this
+DEFAULT_MAX_LATENCY = 0.2  # 200 ms
+PULSE_DURATION = 0.001  # 1ms pulse
+# MLS and Golay stimuli: shortest sequence to play and its peak level
+SEQUENCE_DURATION = 0.05  # 50 ms
+SEQUENCE_AMPLITUDE = 0.5
+# Exponential sine sweep: length, start frequency, end frequency as a fraction of the samplerate, fade length,
+# and the impulse response kept around the latency peak
+SWEEP_DURATION = 0.25  # 250 ms
+SWEEP_LOW = 20.0  # Hz
+SWEEP_HIGH = 0.45
+SWEEP_FADE = 0.005  # 5 ms
+IR_DURATION = 0.05  # 50 ms
+IR_PRE_DURATION = 0.001  # 1 ms
+# Adaptive capture: input level that counts as the returning pulse, and how long to keep recording after it
+DETECT_THRESHOLD = 0.1
+GUARD_DURATION = 0.01  # 10 ms
+# Feedback taps of the maximum-length sequence generator per register length (same table as
+# scipy.signal.max_len_seq, so the sequences match)
+MLS_TAPS = {
+    2: [1], 3: [2], 4: [3], 5: [3], 6: [5], 7: [6], 8: [7, 6, 1], 9: [5], 10: [7], 11: [9],
+    12: [11, 10, 4], 13: [12, 11, 8], 14: [13, 12, 2], 15: [14], 16: [15, 13, 4], 17: [14],
+    18: [11], 19: [18, 17, 14], 20: [17], 21: [19], 22: [21], 23: [18], 24: [23, 22, 17],
+}  # fmt: skip
+# Multichannel mode: shortest Gold code to play, and the peak-to-noise ratio that counts as a connected path
+GOLD_MIN_DURATION = 0.04  # 40 ms
+MIN_PEAK_RATIO = 8.0
+# Weakest correlation peak taken as the returning stimulus; templates give 1 for a unit-gain loopback
+MIN_PEAK_LEVEL = 1e-4  # -80 dB
+# Sub-sample peak refinement: half-width of the window around the peak, upsampling factor for "sinc", and
+# fractional delays per sample tried when calibrating the interpolation bias of a stimulus
+SINC_HALF_WIDTH = 16
+SINC_UPSAMPLING = 32
+BIAS_FRACTIONS = 16
+INTERPOLATION_METHODS = ["parabolic", "gaussian", "sinc", "none"]
+# Repeated measurements: two-sided 95% Student t critical values for 1..30 degrees of freedom (normal beyond),
+# fewest samples before a confidence interval is trusted, and the percentiles tracked per configuration
+T_CRITICAL_95 = (
+    12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228,
+    2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101, 2.093, 2.086,
+    2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045, 2.042,
+)  # fmt: skip
+MIN_CI_SAMPLES = 3
+CONVERGENCE_REPEATS = 20  # session limit per configuration when only --target-ci is given
+REPORT_QUANTILES = (0.5, 0.95)
+# Drift mode: default capture length and pulse period, and ring buffer length in pulse periods so the
+# analysis can fall behind the audio thread for a while without losing pulses
+DRIFT_DURATION = 60.0  # 1 minute
+DRIFT_PERIOD = 1.0  # 1 s
+DRIFT_RING_PERIODS = 8
+# Stimuli usable in drift mode
+DRIFT_STIMULUS_TYPES = ["pulse", "mls", "golay"]
+# Split input/output devices on different host APIs: output queue length, audio queued before the output
+# starts (to ride out callback jitter), and the clock mismatch tolerated before the devices are reported as
+# not clock-locked
+SPLIT_FIFO_DURATION = 0.5  # 500 ms
+SPLIT_PREFILL_DURATION = 0.02  # 20 ms
+CLOCK_LOCK_PPM = 20.0
+# Probed device capabilities are reused for this long before probing again
+CAPABILITY_CACHE_TTL = 7 * 24 * 3600  # 1 week
+# Results export formats: streamed rows or typed columnar files
+EXPORT_FORMATS = ["csv", "jsonl", "parquet", "npz"]
+# Candidates checked when probing a device
+COMMON_SAMPLERATES = [44100, 48000, 88200, 96000, 176400, 192000]
+COMMON_BLOCKSIZES = [32, 64, 128, 256, 512, 1024, 2048]
+
+
+def get_supported_samplerates(device_id, input_channels=1, output_channels=1):
+    """Query supported sample rates for the device; a direction with 0 channels is not checked."""
+    supported = []
+    for sr in COMMON_SAMPLERATES:
+        try:
+            if output_channels:
+                sd.check_output_settings(device=device_id, channels=output_channels, samplerate=sr)
+            if input_channels:
+                sd.check_input_settings(device=device_id, channels=input_channels, samplerate=sr)
+            supported.append(sr)
+        except sd.PortAudioError:
+            continue
+    return supported if supported else [44100]  # Fallback to 44100 if none supported
+
+
+def probe_stream(device_id, samplerate, blocksize, input_channels=1, output_channels=1):
+    """Return True if a stream opens with the given sample rate and block size.
+
+    The stream is duplex unless one direction has 0 channels.
+    """
+    if input_channels and output_channels:
+        stream_class, channels = sd.Stream, (input_channels, output_channels)
+    else:
+        stream_class, channels = (
+            (sd.InputStream, input_channels) if input_channels else (sd.OutputStream, output_channels)
+        )
+    try:
+        with stream_class(
+            device=device_id,
+            samplerate=samplerate,
+            blocksize=blocksize,
+            channels=channels,
+            dtype="float32",
+        ):
+            return True
+    except sd.PortAudioError:
+        return False
+
+
+def get_capability_matrix(device_id, samplerates, input_channels=1, output_channels=1, blocksizes=COMMON_BLOCKSIZES):
+    """Return {samplerate: [blocksizes]} with the combinations that open a stream.
+
+    Drivers accept a contiguous range of buffer sizes between a minimum and a maximum, so only
+    the edges of that range are searched. Each rate starts from the range found at the previous
+    rate, which usually confirms both edges with four probes.
+    """
+    matrix = {}
+    hint = None  # (first, last) valid blocksize index at the previous rate
+    for sr in samplerates:
+        results = {}
+
+        def ok(index, sr=sr, results=results):
+            if index not in results:
+                results[index] = probe_stream(device_id, sr, blocksizes[index], input_channels, output_channels)
+            return results[index]
+
+        # Find one valid blocksize, trying the previous range edges first, then outwards from the middle
+        middle = len(blocksizes) // 2
+        seeds = list(hint) if hint else []
+        seeds += sorted(range(len(blocksizes)), key=lambda i: abs(i - middle))
+        valid = next((i for i in seeds if ok(i)), None)
+        if valid is None:
+            hint = None
+            continue
+
+        # Binary search for the first and last valid blocksize around it
+        lo, hi = 0, valid
+        if hint and ok(hint[0]) and (hint[0] == 0 or not ok(hint[0] - 1)):
+            lo = hi = hint[0]
+        while lo < hi:
+            mid = (lo + hi) // 2
+            lo, hi = (lo, mid) if ok(mid) else (mid + 1, hi)
+        first = lo
+        lo, hi = valid, len(blocksizes) - 1
+        if hint and ok(hint[1]) and (hint[1] == len(blocksizes) - 1 or not ok(hint[1] + 1)):
+            lo = hi = hint[1]
+        while lo < hi:
+            mid = (lo + hi + 1) // 2
+            lo, hi = (mid, hi) if ok(mid) else (lo, mid - 1)
+        last = lo
+
+        hint = (first, last)
+        matrix[sr] = list(blocksizes[first : last + 1])
+    return matrix
+
+
+def device_capability_matrix(cache, device_info, input_channels, output_channels, reprobe=False):
+    """Return ({samplerate: [blocksizes]}, cached) for a device, probing it only without a cache entry.
+
+    Split devices are probed one at a time, with 0 channels for the direction they do not serve.
+    """
+    key = cache.key(device_info, input_channels, output_channels)
+    capabilities = None if reprobe else cache.get(key)
+    if capabilities and "matrix" in capabilities:
+        # JSON object keys are strings
+        return {int(sr): bss for sr, bss in capabilities["matrix"].items()}, True
+    device_id = device_info["index"]
+    samplerates = get_supported_samplerates(device_id, input_channels, output_channels)
+    matrix = get_capability_matrix(device_id, samplerates, input_channels, output_channels)
+    try:
+        cache.put(key, matrix=matrix)
+    except OSError as e:
+        print(f"Warning: Could not write capability cache: {e}")
+    return matrix, False
+
+
+def common_capabilities(input_matrix, output_matrix):
+    """Return the sample rates and block sizes supported by both an input and an output device."""
+    common = {
+        sr: [bs for bs in bss if bs in output_matrix[sr]] for sr, bss in input_matrix.items() if sr in output_matrix
+    }
+    return {sr: bss for sr, bss in common.items() if bss}
+
+
+def get_cache_dir():
+    """Return the per-user cache directory for latencycalc."""
+    if sys.platform == "win32":
+        base = os.environ.get("LOCALAPPDATA", os.path.expanduser("~"))
+    else:
+        base = os.environ.get("XDG_CACHE_HOME", os.path.join(os.path.expanduser("~"), ".cache"))
+    return os.path.join(base, "latencycalc")
+
+
+def get_data_dir():
+    """Return the per-user data directory for latencycalc (measurement history)."""
+    if sys.platform == "win32":
+        base = os.environ.get("LOCALAPPDATA", os.path.expanduser("~"))
+    else:
+        base = os.environ.get("XDG_DATA_HOME", os.path.join(os.path.expanduser("~"), ".local", "share"))
+    return os.path.join(base, "latencycalc")
+
+
+class CapabilityCache:
+    """Probed device capabilities persisted to a JSON file.
+
+    Entries are keyed by device name, host API and channel configuration, so they survive
+    device index changes, and expire after ttl seconds.
+    """
+
+    def __init__(self, path=None, ttl=CAPABILITY_CACHE_TTL):
+        self.path = path or os.path.join(get_cache_dir(), "capabilities.json")
+        self.ttl = ttl
+        try:
+            with open(self.path) as f:
+                self._entries = json.load(f)
+        except (OSError, ValueError):
+            self._entries = {}
+
+    @staticmethod
+    def key(device_info, input_channels, output_channels):
+        """Return the cache key for a device opened with the given channel counts."""
+        hostapi = device_registry.hostapi_name(device_info)
+        return f"{device_info['name']}|{hostapi}|{input_channels}x{output_channels}"
+
+    def get(self, key):
+        """Return the cached capabilities for key, or None if missing or expired."""
+        entry = self._entries.get(key)
+        if entry is None or time.time() - entry["probed_at"] > self.ttl:
+            return None
+        return entry
+
+    def put(self, key, **capabilities):
+        """Store capabilities for key and write the cache file."""
+        self._entries[key] = dict(capabilities, probed_at=time.time())
+        self.save()
+
+    def invalidate(self, key=None):
+        """Drop the entry for key, or every entry if key is None."""
+        if key is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(key, None)
+        self.save()
+
+    def save(self):
+        """Write the cache file atomically."""
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self._entries, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+
+def _parabolic_offset(below, peak, above):
+    """Return the vertex offset of the parabola through three equally spaced points, and its gradient."""
+    curvature = below - 2 * peak + above
+    if curvature >= 0:
+        return 0.0, None
+    # Partial derivatives of the offset with respect to the three points
+    gradient = np.array([above - peak, below - above, peak - below]) / curvature**2
+    return 0.5 * (below - above) / curvature, gradient
+
+
+def correlation_noise(correlation, index):
+    """Return the noise floor of a correlation away from its peak, from the median absolute deviation."""
+    away = np.abs(np.arange(len(correlation)) - index) > SINC_HALF_WIDTH
+    if not away.any():
+        return 0.0
+    values = correlation[away]
+    return float(1.4826 * np.median(np.abs(values - np.median(values))))
+
+
+def check_peak(correlation, index, min_peak_ratio=MIN_PEAK_RATIO):
+    """Raise MeasurementError unless the correlation peak at index stands out from the noise floor."""
+    peak = abs(float(correlation[index]))
+    if peak < MIN_PEAK_LEVEL or peak <= min_peak_ratio * correlation_noise(correlation, index):
+        raise MeasurementError("no_signal", "No stimulus found in the recording; check the loopback connection")
+
+
+def refine_peak(correlation, index, method="parabolic", bias=0.0):
+    """Refine an integer correlation peak to a fractional lag.
+
+    method is "parabolic" (fit through the peak and its neighbours), "gaussian" (the same fit on
+    log values, exact for Gaussian-shaped peaks) or "sinc" (band-limited upsampling around the
+    peak, then a parabolic fit). Returns (lag, uncertainty) in samples; the uncertainty
+    propagates the correlation noise floor through the three-point fit around the peak and adds
+    bias, the interpolation error of the method for this peak shape (see interpolation_bias()).
+    """
+    if method not in ("parabolic", "gaussian", "sinc"):
+        raise ValueError(f"Unknown interpolation method: {method}")
+    if index <= 0 or index >= len(correlation) - 1:
+        return float(index), 0.5
+    points = correlation[index - 1 : index + 2].astype(np.float64)
+    offset, gradient = _parabolic_offset(*points)
+    if gradient is None:
+        return float(index), 0.5
+    noise = correlation_noise(correlation, index) * np.sqrt(np.sum(gradient**2))
+    uncertainty = float(np.hypot(noise, bias))
+
+    if method == "gaussian" and np.all(points > 0):
+        offset = _parabolic_offset(*np.log(points))[0]
+    elif method == "sinc":
+        # Evaluate the band-limited (Lanczos-windowed sinc) interpolant on a fine grid around the peak
+        lags = np.arange(max(index - SINC_HALF_WIDTH, 0), min(index + SINC_HALF_WIDTH + 1, len(correlation)))
+        grid = np.linspace(-1.0, 1.0, 2 * SINC_UPSAMPLING + 1)
+        distance = (index + grid)[:, np.newaxis] - lags
+        kernel = np.sinc(distance) * np.sinc(distance / (SINC_HALF_WIDTH + 1))
+        upsampled = kernel @ correlation[lags].astype(np.float64)
+        peak = int(np.argmax(upsampled))
+        if 0 < peak < len(upsampled) - 1:
+            peak += _parabolic_offset(*upsampled[peak - 1 : peak + 2])[0]
+        offset = grid[0] + peak / SINC_UPSAMPLING
+    return index + float(offset), uncertainty
+
+
+@functools.lru_cache(maxsize=None)
+def have_module(name):
+    """Return True if an optional module is installed, without importing it."""
+    return importlib.util.find_spec(name) is not None
+
+
+@functools.lru_cache(maxsize=None)
+def fft_module():
+    """Return scipy.fft if installed, otherwise numpy.fft; both provide rfft/irfft."""
+    return importlib.import_module("scipy.fft") if have_module("scipy") else np.fft
+
+
+def next_fast_len(target):
+    """Return the smallest 2**a * 3**b * 5**c >= target, a length both FFT backends handle quickly."""
+    best = 1 << max(target - 1, 0).bit_length()
+    power5 = 1
+    while power5 < best:
+        power35 = power5
+        while power35 < best:
+            # Smallest power of two that lifts power35 to the target
+            quotient = -(-target // power35)
+            best = min(best, power35 << max(quotient - 1, 0).bit_length())
+            power35 *= 3
+        power5 *= 5
+    return best
+
+
+class MatchedFilter:
+    """Cross-correlate recordings against a fixed template over a bounded lag window.
+
+    Only lags 0..max_lag are evaluated, so the FFT covers max_lag + len(template) samples
+    instead of the whole recording. The template spectrum is computed once and reused.
+    Templates of shape (samples, codes) and recordings of shape (samples, channels) are
+    correlated pairwise, giving a (lags, channels, codes) result.
+    """
+
+    def __init__(self, template, max_lag):
+        self.template = np.asarray(template, dtype=np.float32)
+        self.max_lag = int(max_lag)
+        # Circular correlation of this many samples has no wrap-around for lags 0..max_lag
+        self.segment_length = self.max_lag + len(self.template)
+        self.fft_length = next_fast_len(self.segment_length)
+        self._template_spectrum = np.conj(fft_module().rfft(self.template, self.fft_length, axis=0))
+
+    def correlate(self, recorded):
+        """Return the correlation of the recording with the template for lags 0..max_lag."""
+        spectrum = fft_module().rfft(recorded[: self.segment_length], self.fft_length, axis=0)
+        bins = len(spectrum)
+        product = spectrum.reshape(bins, -1, 1) * self._template_spectrum.reshape(bins, 1, -1)
+        correlation = fft_module().irfft(product, self.fft_length, axis=0)[: self.max_lag + 1]
+        return correlation.reshape((self.max_lag + 1,) + spectrum.shape[1:] + self.template.shape[1:])
+
+    def find_peak(self, recorded, interpolation="parabolic", bias=0.0):
+        """Return the fractional lag and its uncertainty (in samples) of the best match.
+
+        See refine_peak() for the interpolation methods and bias; "none" returns the integer lag.
+        Raises MeasurementError("no_signal") if the best match does not stand out from the noise.
+        """
+        correlation = self.correlate(recorded)
+        index = int(np.argmax(correlation))
+        check_peak(correlation, index)
+        if interpolation == "none":
+            return float(index), 0.5
+        return refine_peak(correlation, index, interpolation, bias)
+
+
+@functools.lru_cache(maxsize=8)
+def max_len_seq(order):
+    """Return the maximum-length sequence of 2**order - 1 bits (0/1) from a Fibonacci LFSR."""
+    taps = MLS_TAPS[order]
+    state = [1] * order
+    sequence = np.empty(2**order - 1, dtype=np.int8)
+    index = 0
+    for i in range(len(sequence)):
+        feedback = state[index]
+        sequence[i] = feedback
+        for tap in taps:
+            feedback ^= state[(tap + index) % order]
+        state[index] = feedback
+        index = (index + 1) % order
+    sequence.setflags(write=False)
+    return sequence
+
+
+def sequence_order(samplerate, min_duration):
+    """Return the smallest power-of-two order whose sequence lasts at least min_duration seconds."""
+    return max(int(np.ceil(np.log2(min_duration * samplerate + 1))), 2)
+
+
+def golay_pair(order):
+    """Return a Golay complementary pair of length 2**order as +/-1 arrays."""
+    a = b = np.ones(1)
+    for _ in range(order):
+        a, b = np.concatenate((a, b)), np.concatenate((a, -b))
+    return a, b
+
+
+def exponential_sweep(samplerate):
+    """Return an exponential sine sweep and its inverse filter in correlation (template) form.
+
+    The template is the sweep weighted by its instantaneous frequency, which whitens the sweep's
+    pink spectrum, and is scaled for unit gain across the swept band.
+    """
+    samples = int(SWEEP_DURATION * samplerate)
+    t = np.arange(samples) / samplerate
+    high = SWEEP_HIGH * samplerate
+    rate = np.log(high / SWEEP_LOW)
+    sweep = np.sin(2 * np.pi * SWEEP_LOW * SWEEP_DURATION / rate * (np.exp(t * rate / SWEEP_DURATION) - 1))
+    # Raised-cosine fades keep the edges from ringing
+    fade = int(SWEEP_FADE * samplerate)
+    ramp = 0.5 - 0.5 * np.cos(np.pi * np.arange(fade) / fade)
+    sweep[:fade] *= ramp
+    sweep[samples - fade :] *= ramp[::-1]
+    template = sweep * np.exp(t * rate / SWEEP_DURATION)
+    # Normalize to unit gain over the band where the sweep has energy
+    fft_length = 2 * samples
+    response = np.abs(np.fft.rfft(sweep, fft_length) * np.conj(np.fft.rfft(template, fft_length)))
+    frequencies = np.fft.rfftfreq(fft_length, 1 / samplerate)
+    band = (frequencies > 2 * SWEEP_LOW) & (frequencies < 0.8 * high)
+    return sweep, template / np.median(response[band])
+
+
+@functools.lru_cache(maxsize=32)
+def stimulus_code(kind, samplerate, max_lag=0):
+    """Return (code, template) for a stimulus type.
+
+    code holds the samples played for one measurement; template is its matched filter (the
+    inverse filter for the sweep), scaled so a unit-gain loopback gives a correlation peak of 1
+    (unit gain across the swept band for the sweep). Golay pairs are played as
+    A, a silent gap longer than max_lag, then B, so the sum of both correlations (a perfect
+    impulse) is not disturbed by the cross terms.
+    """
+    if kind == "pulse":
+        code = np.ones(int(PULSE_DURATION * samplerate))
+        template = code / len(code)
+    elif kind == "mls":
+        sequence = max_len_seq(sequence_order(samplerate, SEQUENCE_DURATION)) * 2.0 - 1.0
+        code = SEQUENCE_AMPLITUDE * sequence
+        template = sequence / (SEQUENCE_AMPLITUDE * len(sequence))
+    elif kind == "golay":
+        a, b = golay_pair(sequence_order(samplerate, SEQUENCE_DURATION / 2))
+        gap = np.zeros(max_lag + 1)
+        code = SEQUENCE_AMPLITUDE * np.concatenate((a, gap, b))
+        template = np.concatenate((a, gap, b)) / (SEQUENCE_AMPLITUDE * 2 * len(a))
+    elif kind == "sweep":
+        sweep, template = exponential_sweep(samplerate)
+        code = SEQUENCE_AMPLITUDE * sweep
+        template = template / SEQUENCE_AMPLITUDE
+    else:
+        raise ValueError(f"Unknown stimulus type: {kind}")
+    code.setflags(write=False)
+    template.setflags(write=False)
+    return code, template
+
+
+@functools.lru_cache(maxsize=32)
+def get_stimulus_filter(kind, samplerate, max_lag, extra_lag=0):
+    """Return a cached matched filter for a stimulus type, covering extra_lag lags past max_lag."""
+    return MatchedFilter(stimulus_code(kind, samplerate, max_lag)[1], max_lag + extra_lag)
+
+
+@functools.lru_cache(maxsize=None)
+def interpolation_bias(kind, samplerate, method):
+    """Return the worst error (samples) of a refine_peak() method on a stimulus type's correlation peak.
+
+    The stimulus is delayed by BIAS_FRACTIONS fractions of a sample with a band-limited shift and
+    located again, so this is the error of the method for the ideal peak shape; noise adds to it.
+    "none" rounds to whole samples and is off by up to 0.5.
+    """
+    if method == "none":
+        return 0.5
+    max_lag = 4 * SINC_HALF_WIDTH
+    code, template = stimulus_code(kind, samplerate, max_lag)
+    matched_filter = MatchedFilter(template, max_lag)
+    length = next_fast_len(len(code) + max_lag)
+    spectrum = np.fft.rfft(code, length)
+    phase = -2j * np.pi * np.fft.rfftfreq(length)
+    worst = 0.0
+    for delay in max_lag // 2 + np.arange(BIAS_FRACTIONS) / BIAS_FRACTIONS:
+        correlation = matched_filter.correlate(np.fft.irfft(spectrum * np.exp(phase * delay), length))
+        # Sweeps are located on the magnitude of the impulse response, see analyze_sweep()
+        if kind == "sweep":
+            correlation = np.abs(correlation)
+        lag = refine_peak(correlation, int(np.argmax(correlation)), method)[0]
+        worst = max(worst, abs(lag - delay))
+    return float(worst)
+
+
+def make_train(samplerate, duration, dtype="float32", kind="pulse", pulses=1, interval=0.0, max_lag=0):
+    """Generate a stimulus followed by zeros, optionally repeated every interval seconds."""
+    signal = np.zeros(int(duration * samplerate), dtype=dtype)
+    code = stimulus_code(kind, samplerate, max_lag)[0]
+    for k in range(pulses):
+        start = k * int(interval * samplerate)
+        signal[start : start + len(code)] = code
+    return signal
+
+
+def gold_codes(degree, count):
+    """Return count Gold codes of length 2**degree - 1 as columns of +/-1 values.
+
+    The codes are built from an m-sequence and its decimation by 2**k + 1, which form a
+    preferred pair for every degree that is not a multiple of 4.
+    """
+    if degree % 4 == 0:
+        raise ValueError(f"No preferred m-sequence pair exists for degree {degree}")
+    u = max_len_seq(degree) * 2.0 - 1.0
+    length = len(u)
+    if count > length + 2:
+        raise ValueError(f"Degree {degree} yields at most {length + 2} Gold codes")
+    v = u[((2 ** (1 if degree % 2 else 2) + 1) * np.arange(length)) % length]
+    codes = np.empty((length, count))
+    for k in range(count):
+        codes[:, k] = u if k == 0 else v if k == 1 else u * np.roll(v, k - 2)
+    return codes
+
+
+def gold_degree(samplerate, min_duration=GOLD_MIN_DURATION):
+    """Return the smallest usable Gold code degree lasting at least min_duration seconds."""
+    for degree in (7, 9, 10, 11, 13, 14, 15):
+        if 2**degree - 1 >= min_duration * samplerate:
+            return degree
+    return 15
+
+
+def make_gold(samplerate, duration, dtype="float32", count=2, degree=11, amplitude=0.5):
+    """Generate one Gold code per output channel, all starting at sample 0."""
+    signal = np.zeros((int(duration * samplerate), count), dtype=dtype)
+    codes = gold_codes(degree, count)
+    signal[: len(codes)] = amplitude * codes
+    return signal
+
+
+# Stimulus generators by type, called as generator(samplerate, duration, dtype, **params)
+STIMULUS_GENERATORS = {
+    "pulse": functools.partial(make_train, kind="pulse"),
+    "mls": functools.partial(make_train, kind="mls"),
+    "golay": functools.partial(make_train, kind="golay"),
+    "sweep": functools.partial(make_train, kind="sweep"),
+    "gold": make_gold,
+}
+# Stimuli usable for single channel pair measurements
+STIMULUS_TYPES = ["pulse", "mls", "golay", "sweep"]
+
+
+class BufferPool:
+    """Cache of stimuli and preallocated capture buffers reused across measurements.
+
+    Entries are keyed by (samplerate, duration, dtype, stimulus type) and the least recently
+    used ones are evicted once more than max_entries are held.
+    """
+
+    def __init__(self, max_entries=8):
+        self.max_entries = max_entries
+        self._stimuli = collections.OrderedDict()
+        self._buffers = collections.OrderedDict()
+
+    def _get(self, cache, key, factory):
+        if key in cache:
+            cache.move_to_end(key)
+            return cache[key]
+        value = cache[key] = factory()
+        while len(cache) > self.max_entries:
+            cache.popitem(last=False)
+        return value
+
+    def stimulus(self, kind, samplerate, duration, dtype="float32", **params):
+        """Return a cached, read-only stimulus of the given type."""
+        dtype = np.dtype(dtype)
+
+        def generate():
+            signal = STIMULUS_GENERATORS[kind](samplerate, duration, dtype, **params)
+            signal.setflags(write=False)
+            return signal
+
+        key = (samplerate, duration, dtype.str, kind, *sorted(params.items()))
+        return self._get(self._stimuli, key, generate)
+
+    def buffer(self, samplerate, duration, dtype="float32", kind="capture", channels=None):
+        """Return a zeroed buffer; the same array is handed out again for the same key.
+
+        With channels set, the buffer has shape (frames, channels) instead of (frames,).
+        """
+        dtype = np.dtype(dtype)
+        shape = int(duration * samplerate) if channels is None else (int(duration * samplerate), channels)
+        buffer = self._get(
+            self._buffers,
+            (samplerate, duration, dtype.str, kind, channels),
+            lambda: np.empty(shape, dtype=dtype),
+        )
+        buffer.fill(0)
+        return buffer
+
+    def clear(self):
+        """Drop all cached stimuli and buffers."""
+        self._stimuli.clear()
+        self._buffers.clear()
+
+
+# Shared pool so repeated sweep points reuse the same allocations
+buffer_pool = BufferPool()
+
+
+class RingCapture:
+    """Preallocated capture buffer filled from the stream callback.
+
+    Blocks are copied in place without temporaries, and status flags are counted instead of
+    printed from the audio thread. Once `limit` frames have been written the capture stops and
+    sets `done`; in ring mode it never stops and overwrites the oldest frames instead.
+    """
+
+    STATUS_FLAGS = ("input_underflow", "input_overflow", "output_underflow", "output_overflow", "priming_output")
+
+    def __init__(self, buffer, ring=False):
+        self.buffer = buffer
+        self.capacity = len(buffer)
+        self.ring = ring
+        self.limit = self.capacity
+        self.frames = 0  # Total frames written so far
+        self.status_counts = dict.fromkeys(self.STATUS_FLAGS, 0)
+        self.done = threading.Event()
+
+    @property
+    def xruns(self):
+        """Number of callbacks that reported an underflow or overflow."""
+        return sum(count for flag, count in self.status_counts.items() if flag != "priming_output")
+
+    def record_status(self, status):
+        """Count the flags set in a callback status."""
+        if status:
+            for flag in self.STATUS_FLAGS:
+                if getattr(status, flag):
+                    self.status_counts[flag] += 1
+
+    def write(self, block):
+        """Copy a block of frames into the buffer and return how many were stored."""
+        if self.ring:
+            count = len(block)
+            position = self.frames % self.capacity
+            first = min(count, self.capacity - position)
+            np.copyto(self.buffer[position : position + first], block[:first])
+            np.copyto(self.buffer[: count - first], block[first:])
+        else:
+            count = max(0, min(len(block), self.limit - self.frames))
+            np.copyto(self.buffer[self.frames : self.frames + count], block[:count])
+        self.frames += count
+        if not self.ring and self.frames >= self.limit:
+            self.done.set()
+        return count
+
+    def read(self, start, frames):
+        """Return a copy of frames starting at absolute frame start, or None if not (or no longer) held.
+
+        Safe to call while the stream is running: a range that the writer overwrote during the
+        copy is reported as lost too.
+        """
+        if start + frames > self.frames or start < self.frames - self.capacity:
+            return None
+        position = start % self.capacity
+        first = min(frames, self.capacity - position)
+        block = np.concatenate((self.buffer[position : position + first], self.buffer[: frames - first]))
+        return block if start >= self.frames - self.capacity else None
+
+    def status_summary(self):
+        """Describe the status flags seen during the capture, or return an empty string."""
+        return ", ".join(f"{flag} x{count}" for flag, count in self.status_counts.items() if count)
+
+
+# One record per stream callback, see CallbackTimer (numpy structured dtype fields)
+CALLBACK_RECORD_FIELDS = [
+    ("enter", "f8"),  # time.perf_counter() on callback entry
+    ("exit", "f8"),  # time.perf_counter() on callback exit
+    ("frames", "u4"),
+    ("status", "u1"),  # Bit i set for RingCapture.STATUS_FLAGS[i]
+    ("adc", "f8"),  # PortAudio inputBufferAdcTime
+    ("dac", "f8"),  # PortAudio outputBufferDacTime
+    ("current", "f8"),  # PortAudio currentTime
+]
+
+
+class CallbackTimer:
+    """Per-callback timing records stored in a preallocated numpy structured array.
+
+    Call prepare() before starting the stream, then enter() and exit() around the callback body.
+    Callbacks beyond the prepared capacity are counted in `dropped` but not recorded.
+    """
+
+    def __init__(self):
+        self.records = np.zeros(0, dtype=CALLBACK_RECORD_FIELDS)
+        self.count = 0
+        self.dropped = 0
+        self.samplerate = None
+        self.stream_latency = None  # (input, output) latency reported by the stream, in seconds
+
+    def prepare(self, capacity, samplerate):
+        """Make room for capacity callbacks and clear previous records."""
+        if len(self.records) < capacity:
+            self.records = np.zeros(capacity, dtype=CALLBACK_RECORD_FIELDS)
+        self.count = 0
+        self.dropped = 0
+        self.samplerate = samplerate
+        self.stream_latency = None
+
+    def enter(self, frames, stream_time, status):
+        """Record the start of a callback and return its record index (or -1 if full)."""
+        index = self.count
+        if index >= len(self.records):
+            self.dropped += 1
+            return -1
+        bits = 0
+        if status:
+            for bit, flag in enumerate(RingCapture.STATUS_FLAGS):
+                if getattr(status, flag):
+                    bits |= 1 << bit
+        self.records[index] = (
+            time.perf_counter(),
+            0.0,
+            frames,
+            bits,
+            stream_time.inputBufferAdcTime,
+            stream_time.outputBufferDacTime,
+            stream_time.currentTime,
+        )
+        self.count += 1
+        return index
+
+    def exit(self, index):
+        """Record the end of the callback started with enter()."""
+        if index >= 0:
+            self.records["exit"][index] = time.perf_counter()
+
+    def summary(self):
+        """Summarize callback CPU time against the block period, interval jitter and xruns (times in ms)."""
+        records = self.records[: self.count]
+        if not len(records):
+            return {"callbacks": 0, "dropped": self.dropped}
+        period = records["frames"] / self.samplerate * 1000
+        cpu = (records["exit"] - records["enter"]) * 1000
+        intervals = np.diff(records["enter"]) * 1000
+        xrun_mask = sum(1 << bit for bit, flag in enumerate(RingCapture.STATUS_FLAGS) if flag != "priming_output")
+        return {
+            "callbacks": len(records),
+            "dropped": self.dropped,
+            "block_period_ms": float(np.mean(period)),
+            "cpu_mean_ms": float(np.mean(cpu)),
+            "cpu_max_ms": float(np.max(cpu)),
+            "cpu_load_max": float(np.max(cpu / period)),
+            "interval_mean_ms": float(np.mean(intervals)) if len(intervals) else 0.0,
+            "interval_jitter_ms": float(np.std(intervals)) if len(intervals) else 0.0,
+            "xruns": int(np.count_nonzero(records["status"] & xrun_mask)),
+        }
+
+
+def format_timing_summary(summary):
+    """Return a one-line description of a CallbackTimer summary."""
+    if not summary["callbacks"]:
+        return "no callbacks recorded"
+    return (
+        f"{summary['callbacks']} callbacks, CPU mean {summary['cpu_mean_ms']:.3f} ms / max {summary['cpu_max_ms']:.3f} ms "
+        f"of {summary['block_period_ms']:.2f} ms period (peak load {summary['cpu_load_max']:.0%}), "
+        f"interval jitter {summary['interval_jitter_ms']:.3f} ms, xruns {summary['xruns']}"
+    )
+
+
+class DeviceRegistry:
+    """One snapshot of the PortAudio device list, indexed by fingerprint for lookups.
+
+    Enumerating devices is slow on systems with many virtual devices, so the list is queried
+    once, on first use, and reused until refresh(). Devices are dicts as returned by
+    sd.query_devices(), plus their "index", "hostapi_name" and "fingerprint".
+    """
+
+    def __init__(self):
+        self.devices = None
+
+    def refresh(self):
+        """Enumerate devices and host APIs again and rebuild the fingerprint index."""
+        hostapis = [dict(api) for api in sd.query_hostapis()]
+        devices = []
+        for i, device in enumerate(sd.query_devices()):
+            device = dict(device, index=i, hostapi_name=hostapis[device["hostapi"]]["name"])
+            device["fingerprint"] = self.fingerprint(device)
+            devices.append(device)
+        by_fingerprint = {}
+        for device in devices:
+            by_fingerprint.setdefault(device["fingerprint"], []).append(device["index"])
+        self.by_fingerprint = by_fingerprint
+        self.hostapis = hostapis
+        self.devices = devices
+        return devices
+
+    @staticmethod
+    def fingerprint(device_info):
+        """Return a short id for a device that survives re-enumeration: a hash of its name,
+        host API and channel counts (identical units share it)."""
+        identity = (
+            f"{device_info['name']}|{device_info['hostapi_name']}|"
+            f"{device_info['max_input_channels']}x{device_info['max_output_channels']}"
+        )
+        return hashlib.sha1(identity.encode()).hexdigest()[:12]
+
+    def _snapshot(self):
+        return self.devices if self.devices is not None else self.refresh()
+
+    def __len__(self):
+        return len(self._snapshot())
+
+    def __iter__(self):
+        return iter(self._snapshot())
+
+    def __getitem__(self, device_id):
+        return self._snapshot()[device_id]
+
+    def get(self, device_id):
+        """Return the device with this index, or None if there is none."""
+        devices = self._snapshot()
+        return devices[device_id] if device_id is not None and 0 <= device_id < len(devices) else None
+
+    def hostapi_name(self, device_info):
+        """Return the name of the host API a device belongs to."""
+        self._snapshot()
+        return self.hostapis[device_info["hostapi"]]["name"]
+
+    def select(self, device_id=None, name=None, hostapi=None, fingerprint=None):
+        """Resolve device selectors to exactly one device in one pass over the snapshot.
+
+        name is a case-insensitive substring, or a glob pattern if it contains *, ? or [;
+        hostapi is compared case-insensitively. Every given selector must match. Returns
+        (device, None), or (None, message) if no device or more than one matches.
+        """
+        devices = self._snapshot()
+        if fingerprint is not None:
+            candidates = [devices[i] for i in self.by_fingerprint.get(fingerprint, [])]
+        elif device_id is not None:
+            candidates = [devices[device_id]] if 0 <= device_id < len(devices) else []
+        else:
+            candidates = devices
+        pattern = None
+        if name is not None:
+            pattern = name.lower() if any(c in name for c in "*?[") else f"*{name.lower()}*"
+        matches = [
+            d
+            for d in candidates
+            if (device_id is None or d["index"] == device_id)
+            and (hostapi is None or d["hostapi_name"].lower() == hostapi.lower())
+            and (pattern is None or fnmatch.fnmatchcase(d["name"].lower(), pattern))
+        ]
+        if len(matches) == 1:
+            return matches[0], None
+        given = {"index": device_id, "name": name, "host API": hostapi, "fingerprint": fingerprint}
+        criteria = ", ".join(f"{k} {v!r}" for k, v in given.items() if v is not None)
+        if not matches:
+            return None, f"No device matches {criteria}"
+        found = "; ".join(f"{d['index']}: {d['name']} ({d['hostapi_name']}, {d['fingerprint']})" for d in matches)
+        return None, f"{len(matches)} devices match {criteria}: {found}"
+
+    def format(self):
+        """Render the device list one line per device, like sounddevice's own listing."""
+        return "\n".join(
+            f"{d['index']:>3} {d['name']}, {d['hostapi_name']} "
+            f"({d['max_input_channels']} in, {d['max_output_channels']} out) [{d['fingerprint']}]"
+            for d in self._snapshot()
+        )
+
+
+# Shared device snapshot, see DeviceRegistry
+device_registry = DeviceRegistry()
+
+
+def find_asio_device():
+    """Return the index of the first device with "ASIO" in its name, or None."""
+    for device in device_registry:
+        if "ASIO" in device["name"]:
+            return device["index"]
+    return None
+
+
+def select_device(device_id=None, name=None, hostapi=None, fingerprint=None):
+    """Return (device_info, error) for the given selectors, see DeviceRegistry.select().
+
+    Without any selector the first device with "ASIO" in its name is used.
+    """
+    if device_id is None and name is None and hostapi is None and fingerprint is None:
+        device_info = device_registry.get(find_asio_device())
+        return (device_info, None) if device_info is not None else (None, "No ASIO device found")
+    return device_registry.select(device_id, name, hostapi, fingerprint)
+
+
+def select_device_pair(
+    device_id=None, name=None, hostapi=None, fingerprint=None, input_device=None, output_device=None
+):
+    """Return (input_info, output_info, error) for the device selectors of a measurement.
+
+    input_device and output_device (a device index or a name pattern) pick the input and the output
+    device separately; a direction without one uses the device picked by select_device().
+    """
+    selected = {}
+    for direction, selector in (("Input", input_device), ("Output", output_device)):
+        if selector is None:
+            continue
+        if selector.isdigit():
+            info, error = device_registry.select(device_id=int(selector))
+        else:
+            info, error = device_registry.select(name=selector)
+        if error is not None:
+            return None, None, f"{direction} device: {error}"
+        selected[direction] = info
+    device_info = None
+    if len(selected) < 2:
+        device_info, error = select_device(device_id, name, hostapi, fingerprint)
+        if error is not None:
+            return None, None, error
+    return selected.get("Input", device_info), selected.get("Output", device_info), None
+
+
+def driver_max_latency(device_info, margin=2.0, output_info=None):
+    """Derive a lag search bound (in seconds) from the driver-reported latencies.
+
+    For split devices, output_info gives the output device.
+    """
+    output_info = output_info or device_info
+    reported = device_info["default_high_input_latency"] + output_info["default_high_output_latency"]
+    return max(DEFAULT_MAX_LATENCY, margin * reported)
+
+
+def device_pair(device_id):
+    """Return (input_info, output_info) for a device index or an (input, output) pair of indices."""
+    input_id, output_id = device_id if isinstance(device_id, (tuple, list)) else (device_id, device_id)
+    return device_registry[input_id], device_registry[output_id]
+
+
+class SplitStream:
+    """Duplex stream over an input and an output device that cannot share one PortAudio stream.
+
+    Behaves like sd.Stream towards a duplex callback: the callback runs from the input stream, and
+    what it plays is queued for the output stream, which starts once a few blocks are queued.
+    Both streams record their callback times on time.perf_counter(); the line fits through them
+    give the queue delay to take off loopback latencies and show whether the clocks are locked.
+    """
+
+    def __init__(self, device, samplerate, blocksize, channels, dtype, callback):
+        input_device, output_device = device
+        input_channels, output_channels = channels
+        self.callback = callback
+        self.samplerate = samplerate
+        self.queue = np.zeros((max(int(SPLIT_FIFO_DURATION * samplerate), 16 * blocksize), output_channels), dtype)
+        self.block = np.zeros((blocksize, output_channels), dtype)
+        self.prefill = max(int(SPLIT_PREFILL_DURATION * samplerate), 2 * blocksize)
+        self.queued = 0  # Frames produced by the callback so far
+        self.played = 0  # Frames handed to the output stream so far
+        self.underflows = 0
+        self.overruns = 0  # Input callbacks that overwrote queued audio the output had not played yet
+        self.stopped = False  # Set once the callback raised CallbackStop
+        self.input_clock = LinearFit()  # perf_counter() time of every input callback against queued frames
+        self.output_clock = LinearFit()  # ... and of every output callback against played frames
+        self.input = sd.InputStream(
+            device=input_device,
+            samplerate=samplerate,
+            blocksize=blocksize,
+            channels=input_channels,
+            dtype=dtype,
+            callback=self._input_callback,
+        )
+        try:
+            self.output = sd.OutputStream(
+                device=output_device,
+                samplerate=samplerate,
+                blocksize=blocksize,
+                channels=output_channels,
+                dtype=dtype,
+                callback=self._output_callback,
+            )
+        except Exception:
+            self.input.close()
+            raise
+
+    def _input_callback(self, indata, frames, time_info, status):
+        self.input_clock.add(self.queued, time.perf_counter())
+        if frames > len(self.block):
+            self.block = np.zeros((frames, self.block.shape[1]), self.block.dtype)
+        outdata = self.block[:frames]
+        stop = False
+        try:
+            self.callback(indata, outdata, frames, time_info, status)
+        except sd.CallbackStop:
+            stop = True
+        if self.queued + frames - self.played > len(self.queue):
+            self.overruns += 1
+        position = self.queued % len(self.queue)
+        first = min(frames, len(self.queue) - position)
+        self.queue[position : position + first] = outdata[:first]
+        self.queue[: frames - first] = outdata[first:]
+        self.queued += frames
+        if stop:
+            self.stopped = True
+            raise sd.CallbackStop
+
+    def _output_callback(self, outdata, frames, time_info, status):
+        available = self.queued - self.played
+        if not self.played and available < self.prefill:
+            outdata.fill(0)
+            return
+        count = min(frames, available)
+        if count < frames and not self.stopped:
+            self.underflows += 1
+        if count:
+            self.output_clock.add(self.played, time.perf_counter())
+        position = self.played % len(self.queue)
+        first = min(count, len(self.queue) - position)
+        outdata[:first] = self.queue[position : position + first]
+        outdata[first:count] = self.queue[: count - first]
+        outdata[count:] = 0
+        self.played += count
+
+    @property
+    def queue_delay(self):
+        """Seconds between a frame being queued and played, or NaN before both streams ran."""
+        if self.input_clock.count < 2 or self.output_clock.count < 2:
+            return float("nan")
+        return self.output_clock.offset - self.input_clock.offset
+
+    def clock_mismatch(self):
+        """Return (ppm, standard error) of the output clock rate relative to the input clock."""
+        if self.input_clock.count < 3 or self.output_clock.count < 3:
+            return float("nan"), float("nan")
+        ratio = self.output_clock.slope / self.input_clock.slope
+        error = np.hypot(
+            self.input_clock.slope_std / self.input_clock.slope, self.output_clock.slope_std / self.output_clock.slope
+        )
+        return (1 / ratio - 1) * 1e6, float(error * 1e6)
+
+    @property
+    def latency(self):
+        """Input and output latency reported by the streams; the output includes the queue delay."""
+        delay = self.queue_delay
+        return self.input.latency, self.output.latency + (0.0 if np.isnan(delay) else delay)
+
+    def __enter__(self):
+        # __exit__ does not run when __enter__ raises, so close both streams here if either fails to start
+        try:
+            self.input.start()
+            self.output.start()
+        except Exception:
+            self.__exit__(None, None, None)
+            raise
+        return self
+
+    def __exit__(self, *exc_info):
+        for stream in (self.input, self.output):
+            stream.stop()
+            stream.close()
+
+
+def open_stream(device_id, samplerate, blocksize, channels, callback):
+    """Open a duplex float32 stream on a device index or an (input, output) pair of indices.
+
+    A pair on one host API shares a PortAudio stream; devices on different host APIs get a
+    SplitStream.
+    """
+    input_info, output_info = device_pair(device_id)
+    pair = (input_info["index"], output_info["index"])
+    if input_info["hostapi"] != output_info["hostapi"]:
+        return SplitStream(pair, samplerate, blocksize, channels, "float32", callback)
+    return sd.Stream(
+        device=pair if pair[0] != pair[1] else pair[0],
+        samplerate=samplerate,
+        blocksize=blocksize,
+        channels=channels,
+        dtype="float32",
+        callback=callback,
+    )
+
+
+def stream_channels(device_id, input_channel=0, output_channel=0, max_channels=2):
+    """Return the (input, output) channel counts to open on a device index or (input, output) pair.
+
+    At most max_channels per direction are opened (all of them with None). Raises MeasurementError
+    if a direction has no channels or the selected channels are not among the opened ones.
+    """
+    input_info, output_info = device_pair(device_id)
+    input_channels = input_info["max_input_channels"]
+    output_channels = output_info["max_output_channels"]
+    if max_channels is not None:
+        input_channels = min(input_channels, max_channels)
+        output_channels = min(output_channels, max_channels)
+    if input_channels < 1 or output_channels < 1:
+        raise MeasurementError("channel", "Device needs at least one input and one output channel")
+    if input_channel >= input_channels or output_channel >= output_channels:
+        raise MeasurementError(
+            "channel", f"Invalid channel selection (Input: {input_channel}, Output: {output_channel})"
+        )
+    return input_channels, output_channels
+
+
+@contextlib.contextmanager
+def measurement_stream(device_id, samplerate, blocksize, channels, callback):
+    """open_stream() for one measurement session; stream failures are raised as MeasurementError("stream")."""
+    try:
+        with open_stream(device_id, samplerate, blocksize, channels, callback) as stream:
+            yield stream
+    except MeasurementError:
+        raise
+    except Exception as e:
+        raise MeasurementError("stream", str(e)) from e
+
+
+def check_split_stream(stream):
+    """Warn about underflows, overruns and unlocked clocks of a SplitStream; other streams pass silently."""
+    if not isinstance(stream, SplitStream):
+        return
+    if stream.underflows:
+        print(f"Warning: Output device ran out of queued audio {stream.underflows} times")
+    if stream.overruns:
+        print(
+            f"Warning: Output device fell more than {len(stream.queue) / stream.samplerate * 1000:.0f} ms "
+            f"behind the input {stream.overruns} times; unplayed audio was overwritten and the latencies are not reliable"
+        )
+    ppm, error = stream.clock_mismatch()
+    if abs(ppm) > max(CLOCK_LOCK_PPM, 3 * error):
+        print(
+            f"Warning: Input and output clocks are not locked ({ppm:+.0f} ppm apart); "
+            "latency will walk over time, see the drift command"
+        )
+
+
+# Result of a sweep measurement: latency and uncertainty in ms, the impulse response starting
+# ir_start_ms after the stimulus was played, and its magnitude response in dB
+LoopbackResponse = collections.namedtuple(
+    "LoopbackResponse",
+    ["latency_ms", "uncertainty_ms", "ir_start_ms", "impulse_response", "frequencies", "magnitude_db", "samplerate"],
+)
+
+
+class MeasurementError(Exception):
+    """Raised when a measurement cannot be made.
+
+    str() gives the message; `code` is the machine-readable reason: "config", "channel",
+    "timeout", "stream" or "no_signal".
+    """
+
+    def __init__(self, code, message):
+        super().__init__(message)
+        self.code = code
+
+
+# Compact per-configuration result row (numpy structured dtype fields). Latencies are in ms and NaN when not measured, xruns is -1
+# when callbacks were not instrumented, and error is "" or a MeasurementError code
+RESULT_FIELDS = [
+    ("samplerate", "i4"),
+    ("blocksize", "i4"),
+    ("input_channel", "i2"),
+    ("output_channel", "i2"),
+    ("stimulus", "U6"),
+    ("latency_ms", "f8"),
+    ("std_ms", "f4"),
+    ("uncertainty_ms", "f4"),
+    ("ci95_ms", "f4"),
+    ("median_ms", "f8"),
+    ("p95_ms", "f8"),
+    ("count", "i4"),
+    ("timestamp_ms", "f4"),
+    ("xruns", "i4"),
+    ("cpu_load_max", "f4"),
+    ("error", "U9"),
+]
+RESULT_NAMES = tuple(name for name, _ in RESULT_FIELDS)
+
+
+class LatencyResult(collections.namedtuple("LatencyResult", [*RESULT_NAMES, "message"])):
+    """One measured configuration: a RESULT_FIELDS row plus the full error message, if any."""
+
+    __slots__ = ()
+
+    @classmethod
+    def create(cls, samplerate, blocksize, input_channel, output_channel, stimulus, error=None, **fields):
+        """Build a result with unmeasured fields left at NaN / 0 / -1, optionally from a MeasurementError."""
+        row = {name: float("nan") for name, code in RESULT_FIELDS if code[0] == "f"}
+        row.update(count=0, xruns=-1, error="", message="")
+        if error is not None:
+            row.update(error=error.code, message=f"Error: {error}")
+        row.update(fields)
+        return cls(samplerate, blocksize, input_channel, output_channel, stimulus, **row)
+
+    @property
+    def ok(self):
+        return not self.error
+
+    def to_dict(self):
+        """Return the fields as a JSON-safe dict, with unmeasured (NaN) values as None."""
+        return {k: None if isinstance(v, float) and v != v else v for k, v in self._asdict().items()}
+
+
+class SweepTable:
+    """Growable table of LatencyResult rows stored in a numpy structured array (RESULT_FIELDS).
+
+    Error messages are kept aside by row index, since only failed rows have one. driver_latencies
+    holds the device-level driver-reported latencies in ms that apply to every row. A sweep has at
+    most one row per sample rate and block size in the capability matrix (a few dozen rows of
+    about 100 bytes), so the whole table stays in memory for the final summary; full results go
+    to the streaming writers.
+    """
+
+    def __init__(self, capacity=64, driver_latencies=None):
+        self.rows = np.zeros(capacity, dtype=RESULT_FIELDS)
+        self.size = 0
+        self.messages = {}
+        self.driver_latencies = driver_latencies or {}
+
+    def __len__(self):
+        return self.size
+
+    def append(self, result):
+        if self.size == len(self.rows):
+            rows = np.zeros(2 * len(self.rows), dtype=RESULT_FIELDS)
+            rows[: self.size] = self.rows
+            self.rows = rows
+        self.rows[self.size] = result[: len(RESULT_NAMES)]
+        if result.message:
+            self.messages[self.size] = result.message
+        self.size += 1
+
+    @property
+    def array(self):
+        """The filled rows as a structured array view."""
+        return self.rows[: self.size]
+
+    def __getitem__(self, index):
+        index = range(self.size)[index]
+        return LatencyResult(*self.rows[index].item(), self.messages.get(index, ""))
+
+    def __iter__(self):
+        return (self[i] for i in range(self.size))
+
+
+def format_ms(value, precision=3):
+    """Format a value in ms for display, or "" if it was not measured."""
+    return "" if np.isnan(value) else f"{value:.{precision}f}"
+
+
+def analyze_sweep(recorded, samplerate, max_lag, interpolation="parabolic"):
+    """Deconvolve a recorded sweep into latency, impulse response and magnitude response.
+
+    One FFT correlation with the cached inverse filter yields the loopback impulse response;
+    its peak within lags 0..max_lag is the latency.
+    """
+    ir_samples = int(IR_DURATION * samplerate)
+    matched_filter = get_stimulus_filter("sweep", samplerate, max_lag, extra_lag=ir_samples)
+    correlation = matched_filter.correlate(recorded)
+    index = int(np.argmax(np.abs(correlation[: max_lag + 1])))
+    check_peak(correlation[: max_lag + 1], index)
+    if interpolation == "none":
+        lag, uncertainty = float(index), 0.5
+    else:
+        bias = interpolation_bias("sweep", samplerate, interpolation)
+        lag, uncertainty = refine_peak(np.abs(correlation), index, interpolation, bias)
+    start = max(index - int(IR_PRE_DURATION * samplerate), 0)
+    impulse_response = correlation[start : index + ir_samples]
+    spectrum = np.abs(np.fft.rfft(impulse_response))
+    return LoopbackResponse(
+        latency_ms=lag / samplerate * 1000,
+        uncertainty_ms=uncertainty / samplerate * 1000,
+        ir_start_ms=start / samplerate * 1000,
+        impulse_response=impulse_response,
+        frequencies=np.fft.rfftfreq(len(impulse_response), 1 / samplerate),
+        magnitude_db=20 * np.log10(np.maximum(spectrum, 1e-12)),
+        samplerate=samplerate,
+    )
+
+
+def measure_latency_train(
+    device_id,
+    samplerate=44100,
+    blocksize=128,
+    input_channel=0,
+    output_channel=0,
+    pulses=8,
+    pulse_interval=None,
+    max_latency=DEFAULT_MAX_LATENCY,
+    adaptive=True,
+    detect_threshold=DETECT_THRESHOLD,
+    timer=None,
+    interpolation="parabolic",
+    return_uncertainty=False,
+    stimulus="pulse",
+    responses=None,
+):
+    """Measure audio latency from a train of stimuli played in a single stream session.
+
+    The stimulus is a short rectangular pulse, a maximum-length sequence ("mls"), a Golay
+    complementary pair ("golay") or an exponential sine sweep ("sweep"); the sequences trade a
+    longer capture for much higher noise rejection. Returns an array with one latency (in ms)
+    per pulse, or raises MeasurementError. Each correlation peak is refined to a fractional sample with
+    the given interpolation method (see refine_peak()); with return_uncertainty, an array of
+    per-pulse uncertainties (in ms) is returned as well. For sweeps, the LoopbackResponse of
+    every pulse is appended to the responses list if one is given.
+    In adaptive mode the capture stops a guard window after the last pulse is detected
+    (or after max_latency has passed) instead of always recording the full duration.
+    If a CallbackTimer is given, every stream callback is recorded in it. device_id may be an
+    (input, output) pair of device indices, see open_stream().
+    """
+    # Parameters
+    max_lag = int(max_latency * samplerate)
+    # Sweeps also record the impulse response tail after the latest possible peak
+    code_samples = len(stimulus_code(stimulus, samplerate, max_lag)[0])
+    if stimulus == "sweep":
+        code_samples += int(IR_DURATION * samplerate)
+    code_duration = code_samples / samplerate
+
+    # Pulses must be spaced further apart than the stimulus plus the longest latency we search for
+    if pulse_interval is None:
+        pulse_interval = max_latency + code_duration + GUARD_DURATION
+    if pulses > 1 and pulse_interval <= max_latency + code_duration:
+        raise MeasurementError("config", "Pulse interval must be longer than the stimulus plus the maximum latency")
+
+    # At least 1 second of recording after the last pulse
+    recording_duration = max(1.0, max_latency + code_duration + GUARD_DURATION) + (pulses - 1) * pulse_interval
+    interval_samples = int(pulse_interval * samplerate)
+    last_pulse = (pulses - 1) * interval_samples
+    total_samples = int(recording_duration * samplerate)
+    guard_samples = int(GUARD_DURATION * samplerate)
+
+    # Stimulus train and recording buffer come from the shared pool
+    signal = buffer_pool.stimulus(
+        stimulus, samplerate, recording_duration, pulses=pulses, interval=pulse_interval, max_lag=max_lag
+    )
+    recorded = buffer_pool.buffer(samplerate, recording_duration)
+
+    # Capture into the recording buffer, stopping early in adaptive mode
+    capture = RingCapture(recorded)
+    if adaptive:
+        capture.limit = min(last_pulse + max_lag + code_samples + guard_samples, total_samples)
+
+    if timer is not None:
+        timer.prepare(total_samples // max(blocksize, 1) + 16, samplerate)
+
+    # Callback function for simultaneous play and record
+    def callback(indata, outdata, frames, time, status):
+        record = timer.enter(frames, time, status) if timer is not None else -1
+        capture.record_status(status)
+        # Copy specified input channel to recording buffer
+        offset = capture.frames
+        count = capture.write(indata[:, input_channel])
+        # Play pulse on specified output channel (ensure stereo output if needed)
+        outdata.fill(0)  # Clear output buffer
+        outdata[:count, output_channel] = signal[offset : offset + count]
+        # Stop a guard window after the last stimulus has fully come back
+        stop_at = offset + count + code_samples + guard_samples
+        if adaptive and count and offset >= last_pulse and capture.limit > stop_at:
+            block = recorded[offset : offset + count]
+            if block.max() >= detect_threshold or -block.min() >= detect_threshold:
+                capture.limit = stop_at
+        if timer is not None:
+            timer.exit(record)
+        if capture.done.is_set():
+            raise sd.CallbackStop
+
+    channels = stream_channels(device_id, input_channel, output_channel)
+
+    # Set up stream with ASIO device
+    with measurement_stream(device_id, samplerate, blocksize, channels, callback) as stream:
+        # Wait until recording is done
+        if not capture.done.wait(timeout=recording_duration + 1.0):
+            raise MeasurementError("timeout", "Timed out waiting for the recording")
+        if timer is not None:
+            timer.stream_latency = stream.latency
+    if capture.xruns:
+        print(f"Warning: Stream reported {capture.status_summary()}")
+    check_split_stream(stream)
+    # Split devices: output is played from a queue, so time the lags from when it was played
+    queue_ms = stream.queue_delay * 1000 if isinstance(stream, SplitStream) else 0.0
+
+    # Perform bounded-lag cross-correlation after each pulse to find its delay
+    if stimulus == "sweep":
+        analyzed = [
+            analyze_sweep(recorded[k * interval_samples :], samplerate, max_lag, interpolation) for k in range(pulses)
+        ]
+        if responses is not None:
+            responses.extend(analyzed)
+        if queue_ms:
+            analyzed = [
+                r._replace(latency_ms=r.latency_ms - queue_ms, ir_start_ms=r.ir_start_ms - queue_ms) for r in analyzed
+            ]
+        latencies = np.array([response.latency_ms for response in analyzed])
+        uncertainties = np.array([response.uncertainty_ms for response in analyzed])
+    else:
+        matched_filter = get_stimulus_filter(stimulus, samplerate, max_lag)
+        segments = (recorded[k * interval_samples :] for k in range(pulses))
+        bias = interpolation_bias(stimulus, samplerate, interpolation)
+        peaks = np.array([matched_filter.find_peak(segment, interpolation, bias) for segment in segments])
+        latencies, uncertainties = peaks.T / samplerate * 1000
+        latencies -= queue_ms
+    return (latencies, uncertainties) if return_uncertainty else latencies
+
+
+def measure_impulse_response(
+    device_id,
+    samplerate=44100,
+    blocksize=128,
+    input_channel=0,
+    output_channel=0,
+    max_latency=DEFAULT_MAX_LATENCY,
+    adaptive=True,
+    interpolation="parabolic",
+    timer=None,
+):
+    """Measure latency, impulse response and magnitude response of a loopback with one sweep.
+
+    Returns a LoopbackResponse, or raises MeasurementError.
+    """
+    responses = []
+    measure_latency_train(
+        device_id,
+        samplerate=samplerate,
+        blocksize=blocksize,
+        input_channel=input_channel,
+        output_channel=output_channel,
+        pulses=1,
+        max_latency=max_latency,
+        adaptive=adaptive,
+        timer=timer,
+        interpolation=interpolation,
+        stimulus="sweep",
+        responses=responses,
+    )
+    return responses[0]
+
+
+def timestamp_latency(timer):
+    """Estimate round-trip latency from the PortAudio timestamps recorded by a CallbackTimer.
+
+    Returns (timestamp_ms, reported_ms): the median outputBufferDacTime - inputBufferAdcTime
+    over all callbacks (NaN if the host API does not provide timestamps, and always for split
+    devices, whose callbacks only get input stream timestamps), and the input plus
+    output latency reported by the stream (NaN if unknown).
+    """
+    records = timer.records[: timer.count]
+    valid = (records["adc"] > 0) & (records["dac"] > 0)
+    timestamp_ms = float(np.median(records["dac"][valid] - records["adc"][valid]) * 1000) if valid.any() else np.nan
+    reported_ms = sum(timer.stream_latency) * 1000 if timer.stream_latency else np.nan
+    return timestamp_ms, reported_ms
+
+
+def estimate_latency_timestamps(device_id, samplerate=44100, blocksize=128, duration=0.1, timer=None):
+    """Estimate round-trip latency from stream timestamps alone, without a loopback or correlation.
+
+    Runs a silent stream for duration seconds and returns (timestamp_ms, reported_ms) as
+    described in timestamp_latency(), or raises MeasurementError.
+    """
+    timer = timer or CallbackTimer()
+    callbacks = max(int(duration * samplerate) // max(blocksize, 1), 2)
+    timer.prepare(callbacks, samplerate)
+    done = threading.Event()
+
+    # Callback function that only records timestamps and plays silence
+    def callback(indata, outdata, frames, time, status):
+        timer.exit(timer.enter(frames, time, status))
+        outdata.fill(0)
+        if timer.count >= callbacks:
+            done.set()
+            raise sd.CallbackStop
+
+    channels = stream_channels(device_id)
+    with measurement_stream(device_id, samplerate, blocksize, channels, callback) as stream:
+        if not done.wait(timeout=duration + 1.0):
+            raise MeasurementError("timeout", "Timed out waiting for stream callbacks")
+        timer.stream_latency = stream.latency
+    check_split_stream(stream)
+
+    return timestamp_latency(timer)
+
+
+class P2Quantile:
+    """Streaming estimate of one quantile with the P-square algorithm (Jain & Chlamtac, 1985).
+
+    Five markers track the minimum, the quantile, the maximum and two points in between, so memory stays
+    constant however many samples are added. Exact until the fifth sample.
+    """
+
+    def __init__(self, quantile):
+        self.quantile = quantile
+        self.heights = []
+        self.positions = [0, 1, 2, 3, 4]
+        self.desired = [0.0, 2 * quantile, 4 * quantile, 2 + 2 * quantile, 4.0]
+        self.increments = [0.0, quantile / 2, quantile, (1 + quantile) / 2, 1.0]
 
-def get_supported_samplerates(device_id, input_channels=1, output_channels=1):
-    """Query supported sample rates for the device."""
-    common_samplerates = [44100, 48000, 88200, 96000, 176400, 192000]
-    supported = []
-    for sr in common_samplerates:
+    def add(self, x):
+        q, n = self.heights, self.positions
+        if len(q) < 5:
+            q.append(x)
+            q.sort()
+            return
+        if x < q[0]:
+            q[0] = x
+            k = 0
+        elif x >= q[4]:
+            q[4] = x
+            k = 3
+        else:
+            k = next(i for i in range(4) if q[i] <= x < q[i + 1])
+        for i in range(k + 1, 5):
+            n[i] += 1
+        for i in range(5):
+            self.desired[i] += self.increments[i]
+        # Move the three middle markers towards their desired positions, one step at a time
+        for i in range(1, 4):
+            d = self.desired[i] - n[i]
+            if (d >= 1 and n[i + 1] - n[i] > 1) or (d <= -1 and n[i - 1] - n[i] < -1):
+                d = 1 if d > 0 else -1
+                height = q[i] + d / (n[i + 1] - n[i - 1]) * (
+                    (n[i] - n[i - 1] + d) * (q[i + 1] - q[i]) / (n[i + 1] - n[i])
+                    + (n[i + 1] - n[i] - d) * (q[i] - q[i - 1]) / (n[i] - n[i - 1])
+                )
+                if not q[i - 1] < height < q[i + 1]:
+                    height = q[i] + d * (q[i + d] - q[i]) / (n[i + d] - n[i])
+                q[i] = height
+                n[i] += d
+
+    def value(self):
+        if not self.heights:
+            return float("nan")
+        if len(self.heights) < 5:
+            return float(np.quantile(self.heights, self.quantile))
+        return float(self.heights[2])
+
+
+class RunningStats:
+    """Streaming mean, variance (Welford), range and quantiles of a series of latencies in ms."""
+
+    def __init__(self, quantiles=REPORT_QUANTILES):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = float("inf")
+        self.max = float("-inf")
+        self.quantiles = {q: P2Quantile(q) for q in quantiles}
+
+    def add(self, x):
+        x = float(x)
+        self.count += 1
+        delta = x - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (x - self.mean)
+        self.min = min(self.min, x)
+        self.max = max(self.max, x)
+        for sketch in self.quantiles.values():
+            sketch.add(x)
+
+    def extend(self, values):
+        for x in values:
+            self.add(x)
+
+    @property
+    def variance(self):
+        """Sample variance (n - 1 denominator)."""
+        return self.m2 / (self.count - 1) if self.count > 1 else float("nan")
+
+    @property
+    def std(self):
+        return float(np.sqrt(self.variance))
+
+    def ci_halfwidth(self):
+        """Half-width of the 95% confidence interval of the mean."""
+        if self.count < 2:
+            return float("nan")
+        df = self.count - 1
+        t = T_CRITICAL_95[df - 1] if df <= len(T_CRITICAL_95) else 1.96
+        return t * self.std / np.sqrt(self.count)
+
+    def quantile(self, q):
+        return self.quantiles[q].value()
+
+    def result_fields(self):
+        """Return the LatencyResult fields for these statistics; spread fields need two samples."""
+        fields = {"latency_ms": self.mean, "count": self.count}
+        if self.count > 1:
+            median, p95 = (self.quantile(q) for q in REPORT_QUANTILES)
+            fields.update(std_ms=self.std, ci95_ms=self.ci_halfwidth(), median_ms=median, p95_ms=p95)
+        return fields
+
+    def converged(self, target_ci, min_samples=MIN_CI_SAMPLES):
+        """True once the full 95% confidence interval is narrower than target_ci (ms)."""
+        return self.count >= min_samples and 2 * self.ci_halfwidth() <= target_ci
+
+
+class RollingWindow:
+    """Statistics over the last `size` latencies, kept in a fixed-size ring buffer."""
+
+    def __init__(self, size):
+        self.values = np.full(size, np.nan)
+        self.count = 0  # samples added in total
+
+    def add(self, x):
+        self.values[self.count % len(self.values)] = x
+        self.count += 1
+
+    def summary(self, quantiles=REPORT_QUANTILES):
+        """Return n, mean, std, min, max and quantiles (ms) of the window; None values while empty."""
+        window = self.values[: min(self.count, len(self.values))]
+        window = window[~np.isnan(window)]
+        summary = {"n": len(window)}
+        if not len(window):
+            return dict(summary, mean=None, std=None, min=None, max=None, **{f"p{q * 100:g}": None for q in quantiles})
+        summary.update(mean=float(np.mean(window)), std=float(np.std(window)))
+        summary.update(min=float(np.min(window)), max=float(np.max(window)))
+        for q, value in zip(quantiles, np.quantile(window, quantiles)):
+            summary[f"p{q * 100:g}"] = float(value)
+        return summary
+
+
+class LinearFit:
+    """Streaming least-squares line fit y = offset + slope * x, with constant memory."""
+
+    def __init__(self):
+        self.count = 0
+        self.mean_x = 0.0
+        self.mean_y = 0.0
+        self.sxx = 0.0
+        self.sxy = 0.0
+        self.syy = 0.0
+
+    def add(self, x, y):
+        self.count += 1
+        dx = x - self.mean_x
+        dy = y - self.mean_y
+        self.mean_x += dx / self.count
+        self.mean_y += dy / self.count
+        self.sxx += dx * (x - self.mean_x)
+        self.sxy += dx * (y - self.mean_y)
+        self.syy += dy * (y - self.mean_y)
+
+    @property
+    def slope(self):
+        return self.sxy / self.sxx if self.sxx > 0 else float("nan")
+
+    @property
+    def offset(self):
+        return self.mean_y - self.slope * self.mean_x
+
+    @property
+    def residual_std(self):
+        """Standard deviation of the residuals around the line (n - 2 denominator)."""
+        if self.count < 3:
+            return float("nan")
+        return float(np.sqrt(max(self.syy - self.slope * self.sxy, 0.0) / (self.count - 2)))
+
+    @property
+    def slope_std(self):
+        """Standard error of the slope."""
+        return self.residual_std / np.sqrt(self.sxx) if self.sxx > 0 else float("nan")
+
+
+def repeat_measurement(measure_once, repeats, target_ci=None, min_samples=MIN_CI_SAMPLES):
+    """Call measure_once() up to `repeats` times and accumulate every latency into a RunningStats.
+
+    measure_once returns (latencies, uncertainties) in ms or raises MeasurementError. With target_ci (ms) the
+    loop stops as soon as the 95% confidence interval of the mean is narrower than that. Returns
+    (stats, uncertainty, error) where uncertainty is the propagated sub-sample uncertainty of the mean
+    and error the last MeasurementError, or None.
+    """
+    stats = RunningStats()
+    squared_uncertainty = 0.0
+    error = None
+    for _ in range(repeats):
         try:
-            sd.check_output_settings(device=device_id, channels=output_channels, samplerate=sr)
-            sd.check_input_settings(device=device_id, channels=input_channels, samplerate=sr)
-            supported.append(sr)
-        except sd.PortAudioError:
+            latencies, uncertainties = measure_once()
+        except MeasurementError as e:
+            error = e
             continue
-    return supported if supported else [44100]  # Fallback to 44100 if none supported
+        stats.extend(latencies)
+        squared_uncertainty += float(np.sum(np.square(uncertainties)))
+        if target_ci is not None and stats.converged(target_ci, min_samples):
+            break
+    uncertainty = np.sqrt(squared_uncertainty) / stats.count if stats.count else float("nan")
+    return stats, float(uncertainty), error
 
 
-def get_supported_blocksizes(device_id, samplerate, input_channels=1, output_channels=1):
-    """Query supported block sizes for the device."""
-    common_blocksizes = [32, 64, 128, 256, 512, 1024, 2048]
-    supported = []
-    for bs in common_blocksizes:
+def measure_latency(
+    device_id,
+    samplerate=44100,
+    blocksize=128,
+    input_channel=0,
+    output_channel=0,
+    max_latency=DEFAULT_MAX_LATENCY,
+    adaptive=True,
+    detect_threshold=DETECT_THRESHOLD,
+    pulses=1,
+    interpolation="parabolic",
+    stimulus="pulse",
+    repeats=1,
+    target_ci=None,
+    timer=None,
+    responses=None,
+    on_stats=None,
+):
+    """Measure audio latency by sending a pulse and detecting it in the recording.
+
+    With pulses > 1 the mean latency of a pulse train played in one stream session is reported.
+    The correlation peak is refined to a fractional sample with the given interpolation method.
+    See measure_latency_train() for the stimulus types and repeat_measurement() for repeats and
+    target_ci. With a sweep stimulus, the first session's LoopbackResponse is appended to the
+    `responses` list. on_stats(stats, error), if given, is called with the RunningStats and last
+    MeasurementError once the sessions are done. Returns a LatencyResult; check its `ok`.
+    """
+    params = {
+        "samplerate": samplerate,
+        "blocksize": blocksize,
+        "input_channel": input_channel,
+        "output_channel": output_channel,
+        "stimulus": stimulus,
+    }
+    # The timer is reset every session, so xruns and peak load are accumulated across sessions
+    timing = {"xruns": 0, "cpu_load_max": float("nan")}
+
+    def measure_once():
+        if timer is not None:
+            # Clear the last session's records in case this one fails before preparing the timer
+            timer.prepare(0, samplerate)
         try:
-            with sd.Stream(
-                device=device_id,
+            return measure_latency_train(
+                device_id,
                 samplerate=samplerate,
-                blocksize=bs,
-                channels=(input_channels, output_channels),
-                dtype="float32",
-            ):
-                supported.append(bs)
-        except sd.PortAudioError:
-            continue
-    return supported if supported else [128]  # Fallback to 128 if none supported
+                blocksize=blocksize,
+                input_channel=input_channel,
+                output_channel=output_channel,
+                pulses=pulses,
+                max_latency=max_latency,
+                adaptive=adaptive,
+                detect_threshold=detect_threshold,
+                timer=timer,
+                interpolation=interpolation,
+                return_uncertainty=True,
+                stimulus=stimulus,
+                responses=responses if not responses else None,
+            )
+        finally:
+            if timer is not None:
+                summary = timer.summary()
+                timing["xruns"] += summary.get("xruns", 0)
+                timing["cpu_load_max"] = np.fmax(timing["cpu_load_max"], summary.get("cpu_load_max", float("nan")))
 
+    stats, uncertainty, error = repeat_measurement(measure_once, repeats, target_ci)
+    if on_stats is not None:
+        on_stats(stats, error)
+    if not stats.count:
+        return LatencyResult.create(**params, error=error)
+    fields = stats.result_fields()
+    if timer is not None:
+        fields.update(xruns=timing["xruns"], cpu_load_max=float(timing["cpu_load_max"]))
+    return LatencyResult.create(**params, uncertainty_ms=uncertainty, **fields)
 
-def measure_latency(device_id, samplerate=44100, blocksize=128, input_channel=0, output_channel=0):
-    """Measure audio latency by sending a pulse and detecting it in the recording."""
-    # Parameters
-    pulse_duration = 0.001  # 1ms pulse
-    recording_duration = 1.0  # 1 second of recording
-    samples_per_pulse = int(pulse_duration * samplerate)
-    total_samples = int(recording_duration * samplerate)
 
-    # Generate a simple pulse (a short burst of 1s followed by zeros)
-    pulse = np.zeros(total_samples, dtype=np.float32)
-    pulse[:samples_per_pulse] = 1.0  # Short pulse at the start
+@functools.lru_cache(maxsize=8)
+def get_gold_filters(degree, count, max_lag, chunk=8):
+    """Return cached matched filters for count Gold codes, split into chunks of codes."""
+    codes = gold_codes(degree, count)
+    return tuple(MatchedFilter(codes[:, start : start + chunk], max_lag) for start in range(0, count, chunk))
 
-    # Buffer to store recorded audio
-    recorded = np.zeros(total_samples, dtype=np.float32)
 
-    # Initialize offset for callback
-    offset = 0
+def measure_latency_matrix(
+    device_id,
+    samplerate=44100,
+    blocksize=128,
+    max_latency=DEFAULT_MAX_LATENCY,
+    degree=None,
+    min_peak_ratio=MIN_PEAK_RATIO,
+):
+    """Measure the latency between every output and every input channel in one stream session.
 
-    # Callback function for simultaneous play and record
+    Each output plays its own Gold code, so all paths can be told apart in a single capture.
+    Returns an (inputs, outputs) array of latencies in ms, with NaN where no path was found,
+    or raises MeasurementError.
+    """
+    input_channels, output_channels = stream_channels(device_id, max_channels=None)
+
+    # Parameters
+    degree = degree or gold_degree(samplerate)
+    code_samples = 2**degree - 1
+    max_lag = int(max_latency * samplerate)
+    recording_duration = (code_samples + max_lag) / samplerate + GUARD_DURATION
+
+    # Codes and recording buffer come from the shared pool
+    codes = buffer_pool.stimulus("gold", samplerate, recording_duration, count=output_channels, degree=degree)
+    recorded = buffer_pool.buffer(samplerate, recording_duration, channels=input_channels)
+
+    # Capture every input until the last code has had time to come back
+    capture = RingCapture(recorded)
+
+    # Callback function for simultaneous play and record on all channels
     def callback(indata, outdata, frames, time, status):
-        nonlocal offset
-        if status:
-            print(f"Status: {status}")
-        # Copy specified input channel to recording buffer
-        recorded[offset : offset + frames] = indata[:, input_channel] if indata.shape[1] > 1 else indata.squeeze()
-        # Play pulse on specified output channel (ensure stereo output if needed)
-        outdata.fill(0)  # Clear output buffer
-        outdata[:frames, output_channel] = pulse[offset : offset + frames]
-        # Update offset
-        offset += frames
+        capture.record_status(status)
+        offset = capture.frames
+        count = capture.write(indata)
+        outdata.fill(0)
+        outdata[:count] = codes[offset : offset + count]
+        if capture.done.is_set():
+            raise sd.CallbackStop
 
-    # Get device info to determine channel counts
-    device_info = sd.query_devices()[device_id]
-    input_channels = min(device_info["max_input_channels"], 2)  # Limit to 2 for simplicity
-    output_channels = min(device_info["max_output_channels"], 2)
+    with measurement_stream(device_id, samplerate, blocksize, (input_channels, output_channels), callback):
+        if not capture.done.wait(timeout=recording_duration + 1.0):
+            raise MeasurementError("timeout", "Timed out waiting for the recording")
+    if capture.xruns:
+        print(f"Warning: Stream reported {capture.status_summary()}")
 
-    # Validate channels
-    if input_channel >= input_channels or output_channel >= output_channels:
-        return f"Error: Invalid channel selection (Input: {input_channel}, Output: {output_channel})"
+    # Correlate every input against every code, a chunk of codes at a time to bound memory
+    latencies = np.full((input_channels, output_channels), np.nan)
+    start = 0
+    for matched_filter in get_gold_filters(degree, output_channels, max_lag):
+        correlation = matched_filter.correlate(recorded)
+        delays = np.argmax(correlation, axis=0)
+        peaks = np.take_along_axis(correlation, delays[np.newaxis], axis=0)[0]
+        # Only keep peaks that clearly stand out from the correlation noise floor
+        connected = peaks >= min_peak_ratio * np.std(correlation, axis=0)
+        stop = start + correlation.shape[2]
+        latencies[:, start:stop] = np.where(connected, delays / samplerate * 1000, np.nan)
+        start = stop
+    return latencies
 
-    # Set up stream with ASIO device
-    try:
-        with sd.Stream(
-            device=device_id,
-            samplerate=samplerate,
-            blocksize=blocksize,
-            channels=(input_channels, output_channels),
-            dtype="float32",
-            callback=callback,
-        ):
-            # Wait until recording is done
-            sd.sleep(int(recording_duration * 1000))
-    except Exception as e:
-        return f"Error: {str(e)}"
 
-    # Perform cross-correlation to find the delay
-    correlation = scipy.signal.correlate(recorded, pulse, mode="full")
-    delay_samples = np.argmax(correlation) - (len(pulse) - 1)
-    latency_ms = (delay_samples / samplerate) * 1000
+# Result of a drift measurement: latency drift in ppm (positive when the latency grows) and its
+# standard error, fitted latency at the first pulse and residual spread in ms, pulses analyzed and
+# lost, capture length in seconds and stream xruns
+DriftResult = collections.namedtuple(
+    "DriftResult",
+    ["drift_ppm", "drift_std_ppm", "offset_ms", "residual_ms", "pulses", "missed", "duration_s", "xruns"],
+)
+
+
+def measure_drift(
+    device_id,
+    samplerate=44100,
+    blocksize=128,
+    input_channel=0,
+    output_channel=0,
+    duration=DRIFT_DURATION,
+    period=DRIFT_PERIOD,
+    max_latency=DEFAULT_MAX_LATENCY,
+    interpolation="parabolic",
+    stimulus="pulse",
+    on_pulse=None,
+):
+    """Measure input/output clock drift from a stimulus played every period seconds for duration seconds.
+
+    The input is captured into a ring buffer a few periods long and every pulse is located with
+    sub-sample precision while the stream keeps running, so memory does not grow with the duration.
+    The arrival times are fitted with a line (see LinearFit) whose slope is the drift. on_pulse is
+    called as on_pulse(index, time_s, latency_ms) for every analyzed pulse. device_id may be an
+    (input, output) pair of device indices, see open_stream().
+    Returns a DriftResult, or raises MeasurementError.
+    """
+    # Parameters
+    max_lag = int(max_latency * samplerate)
+    period_samples = int(period * samplerate)
+    pulses = int(duration / period)
+    matched_filter = get_stimulus_filter(stimulus, samplerate, max_lag)
+    if pulses < 3:
+        raise MeasurementError("config", "Drift capture needs at least three pulse periods")
+    if matched_filter.segment_length + int(GUARD_DURATION * samplerate) > period_samples:
+        raise MeasurementError("config", "Pulse period must be longer than the stimulus plus the maximum latency")
+    total_samples = (pulses - 1) * period_samples + matched_filter.segment_length
+
+    # One period of stimulus is played over and over; the input goes to a ring buffer
+    signal = buffer_pool.stimulus(stimulus, samplerate, period, max_lag=max_lag)
+    capture = RingCapture(buffer_pool.buffer(samplerate, DRIFT_RING_PERIODS * period, kind="drift"), ring=True)
+    done = threading.Event()
+
+    # Callback function for simultaneous play and record
+    def callback(indata, outdata, frames, time, status):
+        capture.record_status(status)
+        offset = capture.frames
+        count = capture.write(indata[:, input_channel])
+        # Play the period containing this block, wrapping into the next one if needed
+        outdata.fill(0)
+        count = min(count, max(pulses * period_samples - offset, 0))
+        position = offset % period_samples
+        first = min(count, period_samples - position)
+        outdata[:first, output_channel] = signal[position : position + first]
+        outdata[first:count, output_channel] = signal[: count - first]
+        if capture.frames >= total_samples:
+            done.set()
+            raise sd.CallbackStop
+
+    channels = stream_channels(device_id, input_channel, output_channel)
 
-    return f"{latency_ms:.2f} ms"
+    # Locate every pulse as soon as it has fully come back, while the stream keeps running
+    fit = LinearFit()
+    missed = silent = 0
+    deadline = time.monotonic() + total_samples / samplerate + 2.0
+    with measurement_stream(device_id, samplerate, blocksize, channels, callback) as stream:
+        for k in range(pulses):
+            start = k * period_samples
+            while capture.frames < start + matched_filter.segment_length and not done.is_set():
+                if time.monotonic() > deadline:
+                    raise MeasurementError("timeout", "Timed out waiting for the recording")
+                time.sleep(period / 4)
+            segment = capture.read(start, matched_filter.segment_length)
+            if segment is None:
+                missed += 1
+                continue
+            try:
+                lag, _ = matched_filter.find_peak(segment, interpolation)
+            except MeasurementError:
+                # The pulse did not come back; count it as lost rather than fit noise
+                missed += 1
+                silent += 1
+                continue
+            fit.add(start / samplerate, lag / samplerate)
+            if on_pulse is not None:
+                on_pulse(k, start / samplerate, lag / samplerate * 1000)
+    if capture.xruns:
+        print(f"Warning: Stream reported {capture.status_summary()}")
+    check_split_stream(stream)
+    if fit.count < 3 and silent:
+        raise MeasurementError("no_signal", f"No stimulus found in {silent} of {pulses} periods; check the loopback")
+    if fit.count < 3:
+        raise MeasurementError("timeout", "Analysis fell behind the capture; too few pulses were analyzed")
+
+    # Split devices: output is played from a queue, so time the offset from when it was played
+    queue_delay = stream.queue_delay if isinstance(stream, SplitStream) else 0.0
+    return DriftResult(
+        drift_ppm=fit.slope * 1e6,
+        drift_std_ppm=fit.slope_std * 1e6,
+        offset_ms=(fit.offset - queue_delay) * 1000,
+        residual_ms=fit.residual_std * 1000,
+        pulses=fit.count,
+        missed=missed,
+        duration_s=total_samples / samplerate,
+        xruns=capture.xruns,
+    )
 
 
 @click.group()
@@ -114,126 +1994,1383 @@ def cli():
 
 
 @cli.command()
-def list_interfaces():
+@click.option("--json", "as_json", is_flag=True, help="Print the devices as a JSON list")
+def list_interfaces(as_json):
     """List all available audio interfaces."""
+    if as_json:
+        print(json.dumps(list(device_registry), indent=2))
+        return
     print("Available audio devices:")
-    print(sd.query_devices())
+    print(device_registry.format())
 
 
 @cli.command()
-@click.option("--device-id", type=int, help="Device ID for ASIO device")
+@click.option("--device-id", type=int, help="Device index as shown by list-interfaces")
+@click.option("--device", "device_name", help="Device name: case-insensitive substring or glob pattern")
+@click.option("--hostapi", help="Host API name, e.g. ASIO or WASAPI")
+@click.option("--fingerprint", help="Stable device fingerprint as shown by list-interfaces")
+@click.option("--input-device", help="Record from another device: index or name pattern (default: the device above)")
+@click.option("--output-device", help="Play on another device: index or name pattern (default: the device above)")
 @click.option("--input-channel", type=int, default=0, help="Input channel index (0-based, default 0)")
 @click.option("--output-channel", type=int, default=0, help="Output channel index (0-based, default 0)")
-@click.option("--csv-export/--no-csv-export", default=True, help="Enable/disable CSV export (default True)")
-def measure(device_id, input_channel, output_channel, csv_export):
+@click.option("--csv-export/--no-csv-export", default=True, help="Enable/disable results export (default True)")
+@click.option(
+    "--max-latency",
+    type=float,
+    default=None,
+    help="Upper bound of the latency search in ms (default: derived from driver-reported latencies)",
+)
+@click.option(
+    "--adaptive/--fixed-duration",
+    default=True,
+    help="Stop recording once the pulse has returned instead of recording a full second (default adaptive)",
+)
+@click.option(
+    "--detect-threshold",
+    type=float,
+    default=DETECT_THRESHOLD,
+    help=f"Input level that marks the returning pulse in adaptive mode (default {DETECT_THRESHOLD})",
+)
+@click.option(
+    "--pulses",
+    type=click.IntRange(min=1),
+    default=1,
+    help="Number of pulses played per stream session; the mean and spread are reported (default 1)",
+)
+@click.option("--reprobe", is_flag=True, help="Ignore cached device capabilities and probe the hardware again")
+@click.option("--instrument", is_flag=True, help="Record and report per-callback timing for every measurement")
+@click.option(
+    "--estimator",
+    type=click.Choice(["loopback", "timestamp", "both"]),
+    default="both",
+    help="Measure with a loopback pulse, estimate from stream timestamps only, or report both (default both)",
+)
+@click.option(
+    "--interpolation",
+    type=click.Choice(INTERPOLATION_METHODS),
+    default="parabolic",
+    help="Sub-sample refinement of the correlation peak (default parabolic)",
+)
+@click.option(
+    "--stimulus",
+    type=click.Choice(STIMULUS_TYPES),
+    default="pulse",
+    help="Test signal: 1 ms pulse, maximum-length sequence, Golay complementary pair or exponential sine sweep, "
+    "which also yields the impulse and magnitude response (default pulse)",
+)
+@click.option(
+    "--repeats",
+    type=click.IntRange(min=1),
+    default=None,
+    help=f"Maximum stream sessions per configuration; every pulse feeds running mean, variance and percentiles "
+    f"(default 1, or {CONVERGENCE_REPEATS} with --target-ci)",
+)
+@click.option(
+    "--target-ci",
+    type=click.FloatRange(min=0, min_open=True),
+    default=None,
+    help="Stop repeating a configuration once the 95%% confidence interval of the mean is narrower than this (ms)",
+)
+@click.option(
+    "--export-format",
+    type=click.Choice(EXPORT_FORMATS),
+    default="csv",
+    help="Results file format, appended as each measurement finishes: latency_results.csv, or a JSON Lines, "
+    "Parquet or NPZ file per run (Parquet needs pyarrow, NPZ is used without it; default csv)",
+)
+@click.option(
+    "--export-dir",
+    type=click.Path(file_okay=False),
+    default=".",
+    help="Directory for results files (default current directory)",
+)
+@click.option("--history", is_flag=True, help="Also record every result in the local measurement history database")
+@click.option(
+    "--history-db",
+    "history_db_path",
+    type=click.Path(dir_okay=False),
+    default=None,
+    help="Measurement history database (default history.sqlite in the per-user data directory)",
+)
+def measure(
+    device_id,
+    device_name,
+    hostapi,
+    fingerprint,
+    input_device,
+    output_device,
+    input_channel,
+    output_channel,
+    csv_export,
+    max_latency,
+    adaptive,
+    detect_threshold,
+    pulses,
+    reprobe,
+    instrument,
+    estimator,
+    interpolation,
+    stimulus,
+    repeats,
+    target_ci,
+    export_format,
+    export_dir,
+    history,
+    history_db_path,
+):
     """Measure audio latency for an ASIO device with specified input/output channels."""
 
-    # Find ASIO device if not specified
-    if device_id is None:
-        for i, dev in enumerate(sd.query_devices()):
-            if "ASIO" in dev["name"]:
-                device_id = i
-                break
-
-    if device_id is None or device_id < 0 or device_id >= len(sd.query_devices()):
-        print("Error: No ASIO device found or invalid device ID. Use --device-id -1 to list devices.")
+    input_info, output_info, error = select_device_pair(
+        device_id, device_name, hostapi, fingerprint, input_device, output_device
+    )
+    if error is not None:
+        print(f"Error: {error}. Use list-interfaces to list devices.")
         return
+    split = input_info["index"] != output_info["index"]
+    device_id = (input_info["index"], output_info["index"]) if split else input_info["index"]
 
-    device_info = sd.query_devices()[device_id]
-    print(f"Using device: {device_info['name']}")
-    print(f"Max input channels: {device_info['max_input_channels']}")
-    print(f"Max output channels: {device_info['max_output_channels']}")
+    if split:
+        for role, info in (("Input", input_info), ("Output", output_info)):
+            print(f"{role} device {info['index']}: {info['name']} ({info['hostapi_name']}, {info['fingerprint']})")
+    else:
+        print(
+            f"Using device {device_id}: {input_info['name']} ({input_info['hostapi_name']}, {input_info['fingerprint']})"
+        )
+    print(f"Max input channels: {input_info['max_input_channels']}")
+    print(f"Max output channels: {output_info['max_output_channels']}")
 
     # Validate channel selection
-    if input_channel >= device_info["max_input_channels"]:
-        print(f"Error: Input channel {input_channel} exceeds max input channels ({device_info['max_input_channels']})")
+    if input_channel >= input_info["max_input_channels"]:
+        print(f"Error: Input channel {input_channel} exceeds max input channels ({input_info['max_input_channels']})")
         return
-    if output_channel >= device_info["max_output_channels"]:
+    if output_channel >= output_info["max_output_channels"]:
         print(
-            f"Error: Output channel {output_channel} exceeds max output channels ({device_info['max_output_channels']})"
+            f"Error: Output channel {output_channel} exceeds max output channels ({output_info['max_output_channels']})"
         )
         return
 
     # Get driver-reported latencies
-    low_input_latency = device_info["default_low_input_latency"] * 1000  # Convert to ms
-    high_input_latency = device_info["default_high_input_latency"] * 1000
-    low_output_latency = device_info["default_low_output_latency"] * 1000
-    high_output_latency = device_info["default_high_output_latency"] * 1000
+    low_input_latency = input_info["default_low_input_latency"] * 1000  # Convert to ms
+    high_input_latency = input_info["default_high_input_latency"] * 1000
+    low_output_latency = output_info["default_low_output_latency"] * 1000
+    high_output_latency = output_info["default_high_output_latency"] * 1000
     print("Driver-reported latencies:")
     print(f"  Input: Low = {low_input_latency:.2f} ms, High = {high_input_latency:.2f} ms")
     print(f"  Output: Low = {low_output_latency:.2f} ms, High = {high_output_latency:.2f} ms")
 
-    # Get supported sample rates and block sizes
-    input_channels = min(device_info["max_input_channels"], 2)
-    output_channels = min(device_info["max_output_channels"], 2)
-    samplerates = get_supported_samplerates(device_id, input_channels, output_channels)
-    print(f"Supported sample rates: {samplerates}")
-    blocksizes = get_supported_blocksizes(device_id, samplerates[0], input_channels, output_channels)
-    print(f"Supported block sizes: {blocksizes}")
+    # Bound the lag search window
+    if max_latency is None:
+        max_latency = driver_max_latency(input_info, output_info=output_info)
+    else:
+        max_latency /= 1000
+    if repeats is None:
+        repeats = CONVERGENCE_REPEATS if target_ci is not None else 1
+    print(f"Latency search window: 0 - {max_latency * 1000:.0f} ms")
 
-    # Results list
-    results = []
+    # Get supported sample rates and block sizes, from the cache unless a reprobe is requested;
+    # split devices are probed and cached one at a time
+    input_channels = min(input_info["max_input_channels"], 2)
+    output_channels = min(output_info["max_output_channels"], 2)
+    cache = CapabilityCache()
+    if split:
+        input_matrix, input_cached = device_capability_matrix(cache, input_info, input_channels, 0, reprobe)
+        output_matrix, output_cached = device_capability_matrix(cache, output_info, 0, output_channels, reprobe)
+        matrix, cached = common_capabilities(input_matrix, output_matrix), input_cached and output_cached
+        if input_matrix and output_matrix and not matrix:
+            print("Error: The input and output devices share no sample rate and block size")
+            return
+    else:
+        matrix, cached = device_capability_matrix(cache, input_info, input_channels, output_channels, reprobe)
+    if cached:
+        print(f"Using cached device capabilities from {cache.path} (use --reprobe to refresh)")
+    if not matrix:
+        matrix = {COMMON_SAMPLERATES[0]: [128]}  # Fallback to 44100 Hz / 128 if nothing opened
+    print("Supported block sizes per sample rate:")
+    for sr, bss in matrix.items():
+        print(f"  {sr} Hz: {bss}")
 
-    for sr in samplerates:
-        for bs in blocksizes:
-            print(
-                f"Testing Sample Rate: {sr} Hz, Block Size: {bs}, Input Channel: {input_channel}, Output Channel: {output_channel}"
+    # Results table
+    table = SweepTable(
+        driver_latencies={
+            "low_input": low_input_latency,
+            "high_input": high_input_latency,
+            "low_output": low_output_latency,
+            "high_output": high_output_latency,
+        }
+    )
+    timer = CallbackTimer() if instrument or estimator != "loopback" else None
+
+    run_id = time.strftime("%Y%m%dT%H%M%S")
+    # Split devices are recorded as "input -> output"
+    run_device, run_hostapi = input_info["name"], input_info["hostapi_name"]
+    if split:
+        run_device = f"{run_device} -> {output_info['name']}"
+        if output_info["hostapi_name"] != run_hostapi:
+            run_hostapi = f"{run_hostapi} -> {output_info['hostapi_name']}"
+    metadata = {
+        "run_id": run_id,
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "latencycalc_version": __version__,
+        "platform": sys.platform,
+        "device_name": run_device,
+        "hostapi": run_hostapi,
+        "device_fingerprint": input_info["fingerprint"],
+        "driver_latencies_ms": table.driver_latencies,
+        "output_device_fingerprint": output_info["fingerprint"],
+        "options": {
+            "estimator": estimator,
+            "stimulus": stimulus,
+            "interpolation": interpolation,
+            "pulses": pulses,
+            "repeats": repeats,
+            "target_ci_ms": target_ci,
+            "max_latency_ms": max_latency * 1000,
+            "adaptive": adaptive,
+        },
+    }
+
+    # Results file, appended after every measurement
+    writer = None
+    if csv_export:
+        if export_format == "parquet" and not have_module("pyarrow"):
+            print("Warning: pyarrow is not installed, exporting NPZ instead of Parquet")
+            export_format = "npz"
+        name = "latency_results.csv" if export_format == "csv" else f"latency_results-{run_id}.{export_format}"
+        try:
+            os.makedirs(export_dir, exist_ok=True)
+            path = os.path.join(export_dir, name)
+            writer = (
+                ColumnarWriter(path, metadata)
+                if export_format in ("parquet", "npz")
+                else StreamingWriter(path, metadata)
             )
-            latency = measure_latency(
-                device_id, samplerate=sr, blocksize=bs, input_channel=input_channel, output_channel=output_channel
+            print(f"Appending results to {writer.path}")
+        except OSError as e:
+            print(f"Error creating results file: {e}")
+
+    # Sweep impulse and magnitude responses, appended after every sweep point
+    response_writer = None
+    if csv_export and stimulus == "sweep" and estimator != "timestamp":
+        try:
+            response_writer = SweepResponseWriter(export_dir)
+        except OSError as e:
+            print(f"Error creating response files: {e}")
+
+    history_db = None
+    if history:
+        try:
+            history_db = HistoryDB(history_db_path)
+            history_run = history_db.start_run(run_device, run_hostapi, metadata)
+            print(f"Recording results in {history_db.path}")
+        except (sqlite3.Error, OSError) as e:
+            print(f"Error opening measurement history: {e}")
+            history_db = None
+
+    def report_stats(stats, error):
+        if not stats.count:
+            return
+        if stats.count > 1:
+            median, p95 = (stats.quantile(q) for q in REPORT_QUANTILES)
+            print(
+                f"  {stats.count} measurements: mean {stats.mean:.3f} ms +/- {stats.ci_halfwidth():.3f} ms "
+                f"(95% CI), std {stats.std:.3f} ms, median {median:.3f} ms, "
+                f"p95 {p95:.3f} ms, range {stats.min:.3f} - {stats.max:.3f} ms"
             )
-            results.append(
-                (
-                    sr,
-                    bs,
-                    latency,
-                    input_channel,
-                    output_channel,
-                    low_input_latency,
-                    high_input_latency,
-                    low_output_latency,
-                    high_output_latency,
+        if target_ci is not None and not stats.converged(target_ci):
+            print(f"  Warning: 95% CI still wider than {target_ci} ms after {repeats} sessions")
+        if error is not None:
+            print(f"  Some sessions failed: {error}")
+
+    try:
+        for sr, blocksizes in matrix.items():
+            for bs in blocksizes:
+                print(
+                    f"Testing Sample Rate: {sr} Hz, Block Size: {bs}, Input Channel: {input_channel}, Output Channel: {output_channel}"
                 )
-            )
+                params = {
+                    "samplerate": sr,
+                    "blocksize": bs,
+                    "input_channel": input_channel,
+                    "output_channel": output_channel,
+                }
+                responses = [] if stimulus == "sweep" else None
+                if estimator == "timestamp":
+                    try:
+                        estimate = estimate_latency_timestamps(device_id, samplerate=sr, blocksize=bs, timer=timer)
+                        result = LatencyResult.create(**params, stimulus="none")
+                    except MeasurementError as e:
+                        estimate, result = None, LatencyResult.create(**params, stimulus="none", error=e)
+                else:
+                    result = measure_latency(
+                        device_id,
+                        **params,
+                        max_latency=max_latency,
+                        adaptive=adaptive,
+                        detect_threshold=detect_threshold,
+                        pulses=pulses,
+                        interpolation=interpolation,
+                        stimulus=stimulus,
+                        repeats=repeats,
+                        target_ci=target_ci,
+                        timer=timer,
+                        responses=responses,
+                        on_stats=report_stats,
+                    )
+                    estimate = timestamp_latency(timer) if timer is not None and estimator == "both" else None
+                if timer is not None:
+                    summary = timer.summary()
+                    if estimator == "timestamp":
+                        result = result._replace(
+                            xruns=summary.get("xruns", -1), cpu_load_max=summary.get("cpu_load_max", float("nan"))
+                        )
+                    if instrument:
+                        print(f"  Timing: {format_timing_summary(summary)}")
+                if responses and response_writer is not None:
+                    try:
+                        response_writer.append(sr, bs, responses[0])
+                    except OSError as e:
+                        print(f"Error appending to {response_writer.ir_path}: {e}")
+                if estimate is not None:
+                    # Fall back to the stream-reported latency when the host API has no timestamps
+                    timestamp_ms, reported_ms = estimate
+                    best_ms = reported_ms if np.isnan(timestamp_ms) else timestamp_ms
+                    result = result._replace(timestamp_ms=best_ms)
+                    if not np.isnan(timestamp_ms):
+                        print(f"  Timestamp estimate: {timestamp_ms:.2f} ms (stream reported {reported_ms:.2f} ms)")
+                    elif split:
+                        print(
+                            f"  Timestamp estimate: not available for split input and output devices, "
+                            f"using the stream-reported {reported_ms:.2f} ms"
+                        )
+                    else:
+                        print(
+                            f"  Timestamp estimate: not available from this host API, "
+                            f"using the stream-reported {reported_ms:.2f} ms"
+                        )
+                    if estimator == "timestamp":
+                        result = result._replace(latency_ms=best_ms, count=1)
+                table.append(result)
+                if writer is not None:
+                    try:
+                        writer.append([result])
+                    except OSError as e:
+                        print(f"Error appending to {writer.path}: {e}")
+                if history_db is not None:
+                    try:
+                        history_db.record(history_run, result)
+                    except sqlite3.Error as e:
+                        print(f"Error recording history: {e}")
+    finally:
+        # Close every output also on Ctrl-C or a driver error, so the finished measurements stay readable
+        if history_db is not None:
+            history_db.close()
+        if writer is not None:
+            writer.close()
+        if response_writer is not None:
+            response_writer.close()
 
     # Print results in a table format
     print("\nLatency Measurement Results:")
     print(
-        f"{'Sample Rate (Hz)':<18} {'Block Size':<12} {'Input Ch':<10} {'Output Ch':<10} {'Measured Latency':<15} {'Low In (ms)':<12} {'High In (ms)':<12} {'Low Out (ms)':<12} {'High Out (ms)':<12}"
+        f"{'Sample Rate (Hz)':<18} {'Block Size':<12} {'Stimulus':<10} {'Input Ch':<10} {'Output Ch':<10} {'Measured Latency':<17} {'Std Dev (ms)':<13} {'+/- (ms)':<10} {'N':<6} {'Timestamp (ms)':<15} {'Low In (ms)':<12} {'High In (ms)':<12} {'Low Out (ms)':<12} {'High Out (ms)':<12}"
+    )
+    print("-" * 170)
+    li, hi, lo, ho = table.driver_latencies.values()
+    for r in table:
+        latency = f"{format_ms(r.latency_ms)} ms" if r.ok and not np.isnan(r.latency_ms) else r.message
+        count = r.count or ""
+        print(
+            f"{r.samplerate:<18} {r.blocksize:<12} {r.stimulus:<10} {r.input_channel:<10} {r.output_channel:<10} {latency:<17} {format_ms(r.std_ms):<13} {format_ms(r.uncertainty_ms):<10} {count:<6} {format_ms(r.timestamp_ms, 2):<15} {li:<12.2f} {hi:<12.2f} {lo:<12.2f} {ho:<12.2f}"
+        )
+
+    if writer is not None:
+        print(f"\nResults exported to {writer.path}")
+
+    if response_writer is not None:
+        print(
+            f"Impulse responses exported to {response_writer.ir_path}, "
+            f"magnitude responses to {response_writer.magnitude_path}"
+        )
+
+
+# Columns of latency_results.csv
+RESULT_CSV_HEADER = [
+    "Sample Rate (Hz)",
+    "Block Size",
+    "Input Channel",
+    "Output Channel",
+    "Stimulus",
+    "Measured Latency (ms)",
+    "Latency Std Dev (ms)",
+    "Latency Uncertainty (ms)",
+    "Measurements",
+    "Median Latency (ms)",
+    "P95 Latency (ms)",
+    "Latency CI95 Half-Width (ms)",
+    "Timestamp Latency Estimate (ms)",
+    "Xruns",
+    "Error",
+    "Driver Low Input Latency (ms)",
+    "Driver High Input Latency (ms)",
+    "Driver Low Output Latency (ms)",
+    "Driver High Output Latency (ms)",
+]
+
+
+class StreamingWriter:
+    """Write results to CSV or JSON Lines (by file extension) as each measurement finishes.
+
+    Every row is flushed and synced to disk straight away and nothing is buffered, so a driver
+    crash or Ctrl-C keeps all finished rows. close() appends a footer with the row count: a "#"
+    comment line in CSV, a {"type": "footer"} record in JSON Lines (which starts with a
+    {"type": "run"} metadata record). A file without a footer belongs to an interrupted run.
+    """
+
+    def __init__(self, path, metadata):
+        self.path = path
+        self.format = "jsonl" if path.endswith(".jsonl") else "csv"
+        self.rows = 0
+        self.driver = [f"{value:.2f}" for value in metadata["driver_latencies_ms"].values()]
+        self.file = open(path, "w", newline="")
+        if self.format == "csv":
+            self.writer = csv.writer(self.file)
+            self.writer.writerow(RESULT_CSV_HEADER)
+        else:
+            self._write_record({"type": "run", **metadata})
+        self._sync()
+
+    def _write_record(self, record):
+        self.file.write(json.dumps(record) + "\n")
+
+    def _sync(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def append(self, results):
+        for r in results:
+            if self.format == "csv":
+                self.writer.writerow(
+                    [
+                        r.samplerate,
+                        r.blocksize,
+                        r.input_channel,
+                        r.output_channel,
+                        r.stimulus,
+                        format_ms(r.latency_ms),
+                        format_ms(r.std_ms),
+                        format_ms(r.uncertainty_ms),
+                        r.count,
+                        format_ms(r.median_ms),
+                        format_ms(r.p95_ms),
+                        format_ms(r.ci95_ms),
+                        format_ms(r.timestamp_ms, 2),
+                        r.xruns if r.xruns >= 0 else "",
+                        r.message,
+                        *self.driver,
+                    ]
+                )
+            else:
+                self._write_record({"type": "result", **r.to_dict()})
+            self.rows += 1
+        self._sync()
+
+    def close(self):
+        finished_at = time.strftime("%Y-%m-%dT%H:%M:%S%z")
+        if self.format == "csv":
+            self.file.write(f"# complete: {self.rows} rows, finished {finished_at}\n")
+        else:
+            self._write_record({"type": "footer", "rows": self.rows, "finished_at": finished_at})
+        self._sync()
+        self.file.close()
+
+
+def export_rows(results):
+    """Pack LatencyResults into a RESULT_FIELDS structured array extended with the error message."""
+    width = max([len(r.message) for r in results] + [1])
+    rows = np.zeros(len(results), dtype=RESULT_FIELDS + [("message", f"U{width}")])
+    for i, r in enumerate(results):
+        rows[i] = tuple(r)
+    return rows
+
+
+class ColumnarWriter:
+    """Append result rows to a typed, columnar results file as each measurement finishes.
+
+    The format follows the file extension: ".parquet" writes one Parquet row group per append
+    (requires pyarrow), ".npz" appends one structured array per append to an NPZ archive.
+    Run metadata is stored with the file; read_results() loads either format.
+
+    Only NPZ is crash safe: the archive is readable after every append, while a Parquet file gets
+    its footer in close() and is unreadable if the process dies before that.
+    """
+
+    def __init__(self, path, metadata):
+        self.path = path
+        self.format = os.path.splitext(path)[1].lstrip(".")
+        self.groups = 0
+        encoded = json.dumps(metadata)
+        if self.format == "parquet":
+            # numpy unicode columns are stored as Arrow strings
+            fields = [
+                pa.field(name, pa.string() if code[0] == "U" else pa.from_numpy_dtype(np.dtype(code)))
+                for name, code in RESULT_FIELDS
+            ]
+            self.schema = pa.schema([*fields, pa.field("message", pa.string())], metadata={"latencycalc": encoded})
+            self.parquet = pq.ParquetWriter(path, self.schema)
+        else:
+            with zipfile.ZipFile(path, "w") as archive:
+                archive.writestr("metadata.json", encoded)
+
+    def append(self, results):
+        rows = export_rows(results)
+        if self.format == "parquet":
+            columns = [rows[name].tolist() if rows.dtype[name].kind == "U" else rows[name] for name in rows.dtype.names]
+            self.parquet.write_table(pa.Table.from_arrays(columns, schema=self.schema))
+        else:
+            # Reopening in append mode rewrites the zip directory, so the file stays readable after every row group
+            with zipfile.ZipFile(self.path, "a") as archive, archive.open(f"rows_{self.groups:05d}.npy", "w") as f:
+                np.lib.format.write_array(f, rows, allow_pickle=False)
+        self.groups += 1
+
+    def close(self):
+        if self.format == "parquet":
+            self.parquet.close()
+
+
+def _read_results_file(path):
+    """Return the row groups and run metadata of one results file."""
+    if path.endswith(".parquet"):
+        if not have_module("pyarrow"):
+            raise ImportError("Reading Parquet results requires pyarrow")
+        table = pq.read_table(path)
+        metadata = json.loads(table.schema.metadata[b"latencycalc"])
+        messages = table.column("message").to_pylist()
+        width = max([len(message) for message in messages] + [1])
+        rows = np.zeros(table.num_rows, dtype=RESULT_FIELDS + [("message", f"U{width}")])
+        for name in RESULT_NAMES:
+            rows[name] = table.column(name).to_numpy(zero_copy_only=False)
+        rows["message"] = messages
+        return [rows], metadata
+    with zipfile.ZipFile(path) as archive:
+        metadata = json.loads(archive.read("metadata.json"))
+        names = sorted(name for name in archive.namelist() if name.startswith("rows_"))
+        groups = []
+        for name in names:
+            with archive.open(name) as f:
+                groups.append(np.lib.format.read_array(f, allow_pickle=False))
+    return groups, metadata
+
+
+def read_results(path):
+    """Load results written by ColumnarWriter from one file, or from every results file in a directory.
+
+    Returns (rows, metadata): a structured array with the RESULT_FIELDS columns plus message and
+    run_id, and a dict of run metadata keyed by run_id. Unreadable files in a directory, such as a
+    Parquet file whose run was killed before it was closed, are skipped with a warning.
+    """
+    if os.path.isdir(path):
+        paths = sorted(os.path.join(path, name) for name in os.listdir(path) if name.endswith((".parquet", ".npz")))
+    else:
+        paths = [path]
+    runs, metadata = [], {}
+    for file in paths:
+        try:
+            groups, meta = _read_results_file(file)
+        except Exception as e:
+            if not os.path.isdir(path):
+                raise
+            print(f"Warning: Skipping unreadable results file {file}: {e}")
+            continue
+        run_id = meta.get("run_id", os.path.basename(file))
+        metadata[run_id] = meta
+        runs.extend((rows, run_id) for rows in groups)
+    message_width = max([rows.dtype["message"].itemsize // 4 for rows, _ in runs] + [1])
+    run_id_width = max([len(run_id) for run_id in metadata] + [1])
+    dtype = np.dtype(RESULT_FIELDS + [("message", f"U{message_width}"), ("run_id", f"U{run_id_width}")])
+    result = np.zeros(sum(len(rows) for rows, _ in runs), dtype=dtype)
+    start = 0
+    for rows, run_id in runs:
+        block = result[start : start + len(rows)]
+        for name in rows.dtype.names:
+            block[name] = rows[name]
+        block["run_id"] = run_id
+        start += len(rows)
+    return result, metadata
+
+
+class HistoryDB:
+    """Measurement history in a local SQLite database.
+
+    Every LatencyResult is stored with its run, device name, host API and time, indexed so that
+    per-configuration queries over a time window do not scan the whole history.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS runs (
+            id INTEGER PRIMARY KEY,
+            started_at REAL NOT NULL,
+            device_name TEXT NOT NULL,
+            hostapi TEXT NOT NULL,
+            metadata TEXT
+        );
+        CREATE TABLE IF NOT EXISTS measurements (
+            id INTEGER PRIMARY KEY,
+            run_id INTEGER REFERENCES runs(id),
+            measured_at REAL NOT NULL,
+            device_name TEXT NOT NULL,
+            hostapi TEXT NOT NULL,
+            samplerate INTEGER NOT NULL,
+            blocksize INTEGER NOT NULL,
+            input_channel INTEGER NOT NULL,
+            output_channel INTEGER NOT NULL,
+            stimulus TEXT,
+            latency_ms REAL,
+            std_ms REAL,
+            uncertainty_ms REAL,
+            ci95_ms REAL,
+            median_ms REAL,
+            p95_ms REAL,
+            count INTEGER,
+            timestamp_ms REAL,
+            xruns INTEGER,
+            cpu_load_max REAL,
+            error TEXT,
+            message TEXT
+        );
+        CREATE INDEX IF NOT EXISTS measurements_config ON measurements
+            (device_name, hostapi, samplerate, blocksize, input_channel, output_channel, measured_at);
+        CREATE INDEX IF NOT EXISTS measurements_blocksize ON measurements (device_name, blocksize, measured_at);
+        CREATE INDEX IF NOT EXISTS measurements_time ON measurements (measured_at);
+    """
+    # Columns a query can filter on, in grouping order
+    KEYS = ["device_name", "hostapi", "samplerate", "blocksize", "input_channel", "output_channel"]
+
+    def __init__(self, path=None):
+        self.path = path or os.path.join(get_data_dir(), "history.sqlite")
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.connection = sqlite3.connect(self.path)
+        self.connection.executescript(self.SCHEMA)
+        self.runs = {}  # run id -> (device name, host API) for runs started on this connection
+
+    def start_run(self, device_name, hostapi, metadata=None):
+        """Register a run and return its id."""
+        with self.connection:
+            cursor = self.connection.execute(
+                "INSERT INTO runs (started_at, device_name, hostapi, metadata) VALUES (?, ?, ?, ?)",
+                (time.time(), device_name, hostapi, json.dumps(metadata)),
+            )
+        self.runs[cursor.lastrowid] = (device_name, hostapi)
+        return cursor.lastrowid
+
+    def record(self, run_id, result):
+        """Store one LatencyResult of a run started with start_run(); NaN fields are stored as NULL."""
+        device_name, hostapi = self.runs[run_id]
+        row = {"run_id": run_id, "measured_at": time.time(), "device_name": device_name, "hostapi": hostapi}
+        row.update(result.to_dict())
+        columns = ", ".join(row)
+        with self.connection:
+            self.connection.execute(
+                f"INSERT INTO measurements ({columns}) VALUES ({', '.join('?' * len(row))})", list(row.values())
+            )
+
+    def latencies(self, since=None, **filters):
+        """Return {configuration: latencies} for successful loopback measurements since a Unix time.
+
+        filters are KEYS column values; a configuration is the tuple of KEYS values. Timestamp-only
+        estimates (stimulus "none") are left out, since they measure something else.
+        """
+        clauses = ["latency_ms IS NOT NULL", "error = ''", "stimulus != 'none'"]
+        params = []
+        for name in self.KEYS:
+            if filters.get(name) is not None:
+                clauses.append(f"{name} = ?")
+                params.append(filters[name])
+        if since is not None:
+            clauses.append("measured_at >= ?")
+            params.append(since)
+        keys = ", ".join(self.KEYS)
+        cursor = self.connection.execute(
+            f"SELECT {keys}, latency_ms FROM measurements WHERE {' AND '.join(clauses)} ORDER BY {keys}", params
+        )
+        groups = {}
+        for *config, latency in cursor:
+            groups.setdefault(tuple(config), []).append(latency)
+        return {config: np.array(values) for config, values in groups.items()}
+
+    def close(self):
+        self.connection.close()
+
+
+class MeasurementService:
+    """Measurement jobs for a long-running process that owns the audio hardware.
+
+    PortAudio stays initialized, the device list and capability cache stay loaded, and stimuli,
+    buffers and matched filters stay cached between jobs. Jobs may arrive on several threads;
+    `lock` serializes everything that touches the hardware. Job parameters use the CLI names
+    and units (max_latency in ms).
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.cache = CapabilityCache()
+        self.jobs = 0
+        self.refresh()
+
+    def refresh(self):
+        """Query the device list again, e.g. after plugging in an interface."""
+        with self.lock:
+            return device_registry.refresh()
+
+    def _device(self, job):
+        device_info, error = select_device(
+            job.get("device_id"), job.get("device"), job.get("hostapi"), job.get("fingerprint")
+        )
+        if error is not None:
+            raise ValueError(error)
+        return device_info["index"], device_info
+
+    def _max_latency(self, job, device_info):
+        max_latency = job.get("max_latency")
+        return max_latency / 1000 if max_latency is not None else driver_max_latency(device_info)
+
+    def _count(self, job, name, default):
+        value = job.get(name)
+        value = default if value is None else int(value)
+        if value < 1:
+            raise ValueError(f"{name} must be at least 1, got {value}")
+        return value
+
+    def capabilities(self, job):
+        """Return {samplerate: [blocksizes]} for a device, probing it only on a cache miss."""
+        _, device_info = self._device(job)
+        input_channels = min(device_info["max_input_channels"], 2)
+        output_channels = min(device_info["max_output_channels"], 2)
+        with self.lock:
+            matrix, _ = device_capability_matrix(
+                self.cache, device_info, input_channels, output_channels, bool(job.get("reprobe"))
+            )
+        return matrix
+
+    def measure(self, job):
+        """Run one latency measurement job and return a LatencyResult."""
+        device_id, device_info = self._device(job)
+        pulses = self._count(job, "pulses", 1)
+        # Like the CLI, a target_ci without repeats may run up to CONVERGENCE_REPEATS sessions
+        repeats = self._count(job, "repeats", CONVERGENCE_REPEATS if job.get("target_ci") is not None else 1)
+        timer = CallbackTimer()
+        with self.lock:
+            self.jobs += 1
+            return measure_latency(
+                device_id,
+                samplerate=int(job.get("samplerate", device_info["default_samplerate"])),
+                blocksize=int(job.get("blocksize", 128)),
+                input_channel=int(job.get("input_channel", 0)),
+                output_channel=int(job.get("output_channel", 0)),
+                max_latency=self._max_latency(job, device_info),
+                adaptive=bool(job.get("adaptive", True)),
+                detect_threshold=float(job.get("detect_threshold", DETECT_THRESHOLD)),
+                pulses=pulses,
+                interpolation=job.get("interpolation", "parabolic"),
+                stimulus=job.get("stimulus", "pulse"),
+                repeats=repeats,
+                target_ci=job.get("target_ci"),
+                timer=timer,
+            )
+
+    def matrix(self, job):
+        """Run one channel-matrix job and return the latencies in ms (None where unconnected)."""
+        device_id, device_info = self._device(job)
+        with self.lock:
+            self.jobs += 1
+            try:
+                latencies = measure_latency_matrix(
+                    device_id,
+                    samplerate=int(job.get("samplerate", device_info["default_samplerate"])),
+                    blocksize=int(job.get("blocksize", 256)),
+                    max_latency=self._max_latency(job, device_info),
+                )
+            except MeasurementError as e:
+                return {"error": e.code, "message": f"Error: {e}"}
+        return {"latency_ms": [[None if np.isnan(v) else float(v) for v in row] for row in latencies]}
+
+
+def make_job_server(service, port=None, socket_path=None):
+    """Return an HTTP server for service on 127.0.0.1:port, or on a Unix socket.
+
+    GET /health, /devices and /capabilities?device_id=N; POST /measure, /matrix and /refresh
+    with a JSON job. Responses are JSON; invalid jobs get a 400 with an "error" message.
+    """
+    import http.server
+    import socketserver
+    import urllib.parse
+
+    routes = {
+        ("GET", "/health"): lambda job: {"status": "ok", "version": __version__, "jobs": service.jobs},
+        ("GET", "/devices"): lambda job: list(device_registry),
+        ("GET", "/capabilities"): service.capabilities,
+        ("POST", "/measure"): lambda job: service.measure(job).to_dict(),
+        ("POST", "/matrix"): service.matrix,
+        ("POST", "/refresh"): lambda job: service.refresh(),
+    }
+
+    class JobHandler(http.server.BaseHTTPRequestHandler):
+        def _handle(self, method):
+            url = urllib.parse.urlsplit(self.path)
+            route = routes.get((method, url.path))
+            if route is None:
+                return self._reply(404, {"error": f"No such endpoint: {method} {url.path}"})
+            try:
+                if method == "POST":
+                    body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                    job = json.loads(body) if body else {}
+                    if not isinstance(job, dict):
+                        return self._reply(400, {"error": "Job must be a JSON object"})
+                else:
+                    job = {k: int(v) if v.isdigit() else v for k, v in urllib.parse.parse_qsl(url.query)}
+                payload = route(job)
+            except (ValueError, TypeError, KeyError) as e:
+                return self._reply(400, {"error": str(e)})
+            except Exception as e:
+                return self._reply(500, {"error": str(e)})
+            self._reply(200, payload)
+
+        def do_GET(self):
+            self._handle("GET")
+
+        def do_POST(self):
+            self._handle("POST")
+
+        def _reply(self, status, payload):
+            body = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def address_string(self):
+            return self.client_address[0] if self.client_address else socket_path
+
+    if socket_path is not None:
+
+        class UnixJobServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+            daemon_threads = True
+
+        # Only a stale socket from an earlier run is removed; any other file is left alone
+        if os.path.exists(socket_path):
+            if not stat.S_ISSOCK(os.stat(socket_path).st_mode):
+                raise click.UsageError(f"{socket_path} exists and is not a socket")
+            os.unlink(socket_path)
+        return UnixJobServer(socket_path, JobHandler)
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", port), JobHandler)
+    server.daemon_threads = True
+    return server
+
+
+class SweepResponseWriter:
+    """Write the impulse and magnitude responses of sweep measurements to CSV files in directory.
+
+    Like StreamingWriter, each sweep point is written and synced as soon as it is measured, so
+    no response is held in memory past its own point.
+    """
+
+    def __init__(self, directory=".", ir_file="loopback_response.csv", magnitude_file="loopback_magnitude.csv"):
+        self.ir_path = os.path.join(directory, ir_file)
+        self.magnitude_path = os.path.join(directory, magnitude_file)
+        self.ir_file = open(self.ir_path, "w", newline="")
+        try:
+            self.magnitude_file = open(self.magnitude_path, "w", newline="")
+        except OSError:
+            self.ir_file.close()
+            raise
+        self.ir_writer = csv.writer(self.ir_file)
+        self.ir_writer.writerow(["Sample Rate (Hz)", "Block Size", "Time (ms)", "Impulse Response"])
+        self.magnitude_writer = csv.writer(self.magnitude_file)
+        self.magnitude_writer.writerow(["Sample Rate (Hz)", "Block Size", "Frequency (Hz)", "Magnitude (dB)"])
+        self._sync()
+
+    def _sync(self):
+        for f in (self.ir_file, self.magnitude_file):
+            f.flush()
+            os.fsync(f.fileno())
+
+    def append(self, samplerate, blocksize, response):
+        times = response.ir_start_ms + np.arange(len(response.impulse_response)) / samplerate * 1000
+        for t, value in zip(times, response.impulse_response):
+            self.ir_writer.writerow([samplerate, blocksize, f"{t:.4f}", f"{value:.6g}"])
+        for freq, magnitude in zip(response.frequencies, response.magnitude_db):
+            self.magnitude_writer.writerow([samplerate, blocksize, f"{freq:.2f}", f"{magnitude:.3f}"])
+        self._sync()
+
+    def close(self):
+        self.ir_file.close()
+        self.magnitude_file.close()
+
+
+@cli.command()
+@click.option("--device-id", type=int, help="Device index as shown by list-interfaces")
+@click.option("--device", "device_name", help="Device name: case-insensitive substring or glob pattern")
+@click.option("--hostapi", help="Host API name, e.g. ASIO or WASAPI")
+@click.option("--fingerprint", help="Stable device fingerprint as shown by list-interfaces")
+@click.option("--samplerate", type=int, default=None, help="Sample rate in Hz (default: device default)")
+@click.option("--blocksize", type=int, default=256, help="Block size in frames (default 256)")
+@click.option("--csv-export/--no-csv-export", default=True, help="Enable/disable CSV export (default True)")
+@click.option(
+    "--max-latency",
+    type=float,
+    default=None,
+    help="Upper bound of the latency search in ms (default: derived from driver-reported latencies)",
+)
+def measure_matrix(device_id, device_name, hostapi, fingerprint, samplerate, blocksize, csv_export, max_latency):
+    """Measure the latency of every output/input channel pair at once."""
+
+    device_info, error = select_device(device_id, device_name, hostapi, fingerprint)
+    if error is not None:
+        print(f"Error: {error}. Use list-interfaces to list devices.")
+        return
+    device_id = device_info["index"]
+
+    samplerate = samplerate or int(device_info["default_samplerate"])
+    max_latency = max_latency / 1000 if max_latency is not None else driver_max_latency(device_info)
+    print(f"Using device: {device_info['name']}")
+    print(
+        f"Driving {device_info['max_output_channels']} outputs into {device_info['max_input_channels']} inputs "
+        f"at {samplerate} Hz, block size {blocksize}"
     )
-    print("-" * 110)
-    for sr, bs, lat, ic, oc, li, hi, lo, ho in results:
-        print(f"{sr:<18} {bs:<12} {ic:<10} {oc:<10} {lat:<15} {li:.2f:<12} {hi:.2f:<12} {lo:.2f:<12} {ho:.2f:<12}")
+
+    try:
+        latencies = measure_latency_matrix(
+            device_id, samplerate=samplerate, blocksize=blocksize, max_latency=max_latency
+        )
+    except MeasurementError as e:
+        print(f"Error: {e}")
+        return
+
+    # Print the matrix with one row per input channel
+    print("\nLatency Matrix (ms, rows = input channels, columns = output channels):")
+    print(f"{'':<8}" + "".join(f"{'Out ' + str(oc):>10}" for oc in range(latencies.shape[1])))
+    for ic, row in enumerate(latencies):
+        print(f"{'In ' + str(ic):<8}" + "".join(f"{'-' if np.isnan(lat) else f'{lat:.2f}':>10}" for lat in row))
 
     # Export to CSV if enabled
     if csv_export:
-        csv_file = "latency_results.csv"
+        csv_file = "latency_matrix.csv"
         try:
             with open(csv_file, "w", newline="") as f:
                 writer = csv.writer(f)
-                # Write header
                 writer.writerow(
-                    [
-                        "Sample Rate (Hz)",
-                        "Block Size",
-                        "Input Channel",
-                        "Output Channel",
-                        "Measured Latency (ms)",
-                        "Driver Low Input Latency (ms)",
-                        "Driver High Input Latency (ms)",
-                        "Driver Low Output Latency (ms)",
-                        "Driver High Output Latency (ms)",
-                    ]
+                    ["Sample Rate (Hz)", "Block Size", "Input Channel", "Output Channel", "Measured Latency (ms)"]
                 )
-                # Write data
-                for sr, bs, lat, ic, oc, li, hi, lo, ho in results:
-                    # Clean up latency value for CSV (remove 'ms' for numeric values)
-                    lat_value = lat.replace(" ms", "") if "ms" in lat else lat
-                    writer.writerow([sr, bs, ic, oc, lat_value, f"{li:.2f}", f"{hi:.2f}", f"{lo:.2f}", f"{ho:.2f}"])
+                for (ic, oc), lat in np.ndenumerate(latencies):
+                    writer.writerow([samplerate, blocksize, ic, oc, "" if np.isnan(lat) else f"{lat:.2f}"])
             print(f"\nResults exported to {csv_file}")
         except Exception as e:
             print(f"Error exporting to CSV: {e}")
 
 
+def write_prometheus_textfile(path, labels, metrics):
+    """Atomically write metrics in the Prometheus text format, for node_exporter's textfile collector.
+
+    metrics maps metric name to (help text, value); None values are skipped. Names ending in
+    _total are counters, everything else is a gauge.
+    """
+    escaped = {k: str(v).replace("\\", "\\\\").replace('"', '\\"') for k, v in labels.items()}
+    label_text = ",".join(f'{k}="{v}"' for k, v in escaped.items())
+    lines = []
+    for name, (help_text, value) in metrics.items():
+        if value is None:
+            continue
+        kind = "counter" if name.endswith("_total") else "gauge"
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}", f"{name}{{{label_text}}} {value!r}"]
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write("\n".join(lines) + "\n")
+    os.replace(tmp_path, path)
+
+
+@cli.command()
+@click.option("--device-id", type=int, help="Device index as shown by list-interfaces")
+@click.option("--device", "device_name", help="Device name: case-insensitive substring or glob pattern")
+@click.option("--hostapi", help="Host API name, e.g. ASIO or WASAPI")
+@click.option("--fingerprint", help="Stable device fingerprint as shown by list-interfaces")
+@click.option("--input-channel", type=int, default=0, help="Input channel index (0-based, default 0)")
+@click.option("--output-channel", type=int, default=0, help="Output channel index (0-based, default 0)")
+@click.option("--samplerate", type=int, default=None, help="Sample rate in Hz (default: device default)")
+@click.option("--blocksize", type=int, default=128, help="Block size in frames (default 128)")
+@click.option(
+    "--max-latency",
+    type=float,
+    default=None,
+    help="Upper bound of the latency search in ms (default: derived from driver-reported latencies)",
+)
+@click.option("--pulses", type=click.IntRange(min=1), default=1, help="Pulses per sample (default 1)")
+@click.option("--stimulus", type=click.Choice(STIMULUS_TYPES), default="pulse", help="Test signal (default pulse)")
+@click.option(
+    "--interpolation",
+    type=click.Choice(INTERPOLATION_METHODS),
+    default="parabolic",
+    help="Sub-sample refinement of the correlation peak (default parabolic)",
+)
+@click.option(
+    "--interval", type=click.FloatRange(min=0), default=10.0, help="Seconds between sample starts (default 10)"
+)
+@click.option("--window", type=click.IntRange(min=1), default=60, help="Samples in the rolling window (default 60)")
+@click.option(
+    "--count", type=click.IntRange(min=0), default=0, help="Stop after this many samples (default 0: run until Ctrl-C)"
+)
+@click.option(
+    "--tolerance",
+    type=click.FloatRange(min=0, min_open=True),
+    default=None,
+    help="Flag samples further than this (ms) from the running median",
+)
+@click.option(
+    "--output",
+    type=click.Path(dir_okay=False, allow_dash=True),
+    default="-",
+    help="JSON Lines file that every sample is appended to (default -: stdout)",
+)
+@click.option(
+    "--prometheus",
+    type=click.Path(dir_okay=False),
+    default=None,
+    help="Prometheus textfile rewritten after every sample (e.g. for node_exporter's textfile collector)",
+)
+def monitor(
+    device_id,
+    device_name,
+    hostapi,
+    fingerprint,
+    input_channel,
+    output_channel,
+    samplerate,
+    blocksize,
+    max_latency,
+    pulses,
+    stimulus,
+    interpolation,
+    interval,
+    window,
+    count,
+    tolerance,
+    output,
+    prometheus,
+):
+    """Measure one channel pair at a fixed interval and report rolling statistics.
+
+    Memory stays constant however long it runs: the rolling window and running statistics are
+    fixed-size, and stimuli, buffers and filters are reused from sample to sample.
+    """
+    device_info, error = select_device(device_id, device_name, hostapi, fingerprint)
+    if error is not None:
+        print(f"Error: {error}. Use list-interfaces to list devices.", file=sys.stderr)
+        return
+    samplerate = samplerate or int(device_info["default_samplerate"])
+    max_latency = max_latency / 1000 if max_latency is not None else driver_max_latency(device_info)
+    labels = {
+        "device": device_info["name"],
+        "hostapi": device_info["hostapi_name"],
+        "fingerprint": device_info["fingerprint"],
+        "samplerate": samplerate,
+        "blocksize": blocksize,
+        "input_channel": input_channel,
+        "output_channel": output_channel,
+    }
+    print(
+        f"Monitoring {device_info['name']} ({device_info['hostapi_name']}) in {input_channel} / out {output_channel} "
+        f"at {samplerate} Hz, block size {blocksize}, every {interval:g} s",
+        file=sys.stderr,
+    )
+
+    rolling = RollingWindow(window)
+    overall = RunningStats()
+    errors = xruns = 0
+    timer = CallbackTimer()
+    out = sys.stdout if output == "-" else open(output, "a")
+    start = time.monotonic()
+    sample = 0
+    try:
+        while not count or sample < count:
+            result = measure_latency(
+                device_info["index"],
+                samplerate=samplerate,
+                blocksize=blocksize,
+                input_channel=input_channel,
+                output_channel=output_channel,
+                max_latency=max_latency,
+                pulses=pulses,
+                interpolation=interpolation,
+                stimulus=stimulus,
+                timer=timer,
+            )
+            now = time.time()
+            sample += 1
+            xruns += max(result.xruns, 0)
+            deviation = None
+            if result.ok:
+                if overall.count:
+                    deviation = result.latency_ms - overall.quantile(0.5)
+                rolling.add(result.latency_ms)
+                overall.add(result.latency_ms)
+            else:
+                errors += 1
+            alert = tolerance is not None and deviation is not None and abs(deviation) > tolerance
+            stats = rolling.summary()
+            record = {"time": time.strftime("%Y-%m-%dT%H:%M:%S%z", time.localtime(now)), "unix_time": now}
+            record.update(result.to_dict(), deviation_ms=deviation, alert=alert, window=stats)
+            out.write(json.dumps(record) + "\n")
+            out.flush()
+            if alert:
+                print(
+                    f"Warning: latency {result.latency_ms:.3f} ms is {deviation:+.3f} ms from the running median",
+                    file=sys.stderr,
+                )
+
+            if prometheus:
+                seconds = {k: None if stats[k] is None else stats[k] / 1000 for k in ("mean", "std", "min", "max")}
+                metrics = {
+                    "latencycalc_latency_seconds": (
+                        "Latest measured round-trip latency",
+                        result.latency_ms / 1000 if result.ok else None,
+                    ),
+                    "latencycalc_latency_window_mean_seconds": (
+                        "Mean latency over the rolling window",
+                        seconds["mean"],
+                    ),
+                    "latencycalc_latency_window_stddev_seconds": (
+                        "Latency standard deviation over the window",
+                        seconds["std"],
+                    ),
+                    "latencycalc_latency_window_min_seconds": ("Minimum latency over the window", seconds["min"]),
+                    "latencycalc_latency_window_max_seconds": ("Maximum latency over the window", seconds["max"]),
+                    "latencycalc_samples_total": ("Samples taken since the monitor started", sample),
+                    "latencycalc_errors_total": ("Samples that failed", errors),
+                    "latencycalc_xruns_total": ("Stream xruns seen by the monitor", xruns),
+                    "latencycalc_last_sample_timestamp_seconds": ("Unix time of the latest sample", now),
+                }
+                for q in REPORT_QUANTILES:
+                    value = stats[f"p{q * 100:g}"]
+                    metrics[f"latencycalc_latency_window_p{q * 100:g}_seconds"] = (
+                        f"{q * 100:g}th percentile latency over the window",
+                        None if value is None else value / 1000,
+                    )
+                try:
+                    write_prometheus_textfile(prometheus, labels, metrics)
+                except OSError as e:
+                    print(f"Error writing {prometheus}: {e}", file=sys.stderr)
+
+            # Keep a fixed schedule; after an overrun, skip to the next slot
+            if count and sample >= count:
+                break
+            delay = interval - (time.monotonic() - start) % interval if interval else 0
+            time.sleep(delay)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    if overall.count:
+        print(
+            f"{sample} samples, {errors} failed: mean {overall.mean:.3f} ms, std {overall.std:.3f} ms, "
+            f"range {overall.min:.3f} - {overall.max:.3f} ms",
+            file=sys.stderr,
+        )
+
+
+@cli.command()
+@click.option("--device-id", type=int, help="Device index as shown by list-interfaces")
+@click.option("--device", "device_name", help="Device name: case-insensitive substring or glob pattern")
+@click.option("--hostapi", help="Host API name, e.g. ASIO or WASAPI")
+@click.option("--fingerprint", help="Stable device fingerprint as shown by list-interfaces")
+@click.option("--input-device", help="Record from another device: index or name pattern (default: the device above)")
+@click.option("--output-device", help="Play on another device: index or name pattern (default: the device above)")
+@click.option("--input-channel", type=int, default=0, help="Input channel index (0-based, default 0)")
+@click.option("--output-channel", type=int, default=0, help="Output channel index (0-based, default 0)")
+@click.option("--samplerate", type=int, default=None, help="Sample rate in Hz (default: device default)")
+@click.option("--blocksize", type=int, default=128, help="Block size in frames (default 128)")
+@click.option(
+    "--duration",
+    type=click.FloatRange(min=0, min_open=True),
+    default=DRIFT_DURATION,
+    help=f"Capture length in seconds (default {DRIFT_DURATION:g})",
+)
+@click.option(
+    "--period",
+    type=click.FloatRange(min=0, min_open=True),
+    default=DRIFT_PERIOD,
+    help=f"Seconds between pulses (default {DRIFT_PERIOD:g})",
+)
+@click.option(
+    "--max-latency",
+    type=float,
+    default=None,
+    help="Upper bound of the latency search in ms (default: derived from driver-reported latencies)",
+)
+@click.option(
+    "--stimulus", type=click.Choice(DRIFT_STIMULUS_TYPES), default="pulse", help="Test signal (default pulse)"
+)
+@click.option(
+    "--interpolation",
+    type=click.Choice(INTERPOLATION_METHODS),
+    default="parabolic",
+    help="Sub-sample refinement of the correlation peak (default parabolic)",
+)
+@click.option("--verbose", is_flag=True, help="Print the latency of every pulse")
+def drift(
+    device_id,
+    device_name,
+    hostapi,
+    fingerprint,
+    input_device,
+    output_device,
+    input_channel,
+    output_channel,
+    samplerate,
+    blocksize,
+    duration,
+    period,
+    max_latency,
+    stimulus,
+    interpolation,
+    verbose,
+):
+    """Estimate input/output clock drift from periodic pulses over a long capture."""
+    input_info, output_info, error = select_device_pair(
+        device_id, device_name, hostapi, fingerprint, input_device, output_device
+    )
+    if error is not None:
+        print(f"Error: {error}. Use list-interfaces to list devices.")
+        return
+    split = input_info["index"] != output_info["index"]
+    samplerate = samplerate or int(input_info["default_samplerate"])
+    if max_latency is None:
+        max_latency = driver_max_latency(input_info, output_info=output_info)
+    else:
+        max_latency /= 1000
+    name = f"{input_info['name']} -> {output_info['name']}" if split else input_info["name"]
+    print(
+        f"Measuring drift on {name} in {input_channel} / out {output_channel} at {samplerate} Hz: "
+        f"a pulse every {period:g} s for {duration:g} s"
+    )
+
+    def print_pulse(index, time_s, latency_ms):
+        print(f"  pulse {index + 1:5d} at {time_s:9.3f} s: {latency_ms:.4f} ms")
+
+    try:
+        result = measure_drift(
+            (input_info["index"], output_info["index"]) if split else input_info["index"],
+            samplerate=samplerate,
+            blocksize=blocksize,
+            input_channel=input_channel,
+            output_channel=output_channel,
+            duration=duration,
+            period=period,
+            max_latency=max_latency,
+            interpolation=interpolation,
+            stimulus=stimulus,
+            on_pulse=print_pulse if verbose else None,
+        )
+    except MeasurementError as e:
+        print(f"Error: {e}")
+        return
+    print(f"Drift: {result.drift_ppm:+.3f} ppm (std error {result.drift_std_ppm:.3f} ppm)")
+    print(f"Initial latency: {result.offset_ms:.4f} ms, residual std {result.residual_ms:.4f} ms")
+    print(
+        f"Latency change over {result.duration_s:.1f} s: {result.drift_ppm * result.duration_s / 1000:+.4f} ms "
+        f"({result.pulses} pulses, {result.missed} lost)"
+    )
+
+
+@cli.command()
+@click.option("--device", "device_name", default=None, help="Device name as shown by list-interfaces (default all)")
+@click.option("--hostapi", default=None, help="Host API name, e.g. ASIO (default all)")
+@click.option("--samplerate", type=int, default=None, help="Sample rate in Hz (default all)")
+@click.option("--blocksize", type=int, default=None, help="Block size in frames (default all)")
+@click.option("--input-channel", type=int, default=None, help="Input channel (default all)")
+@click.option("--output-channel", type=int, default=None, help="Output channel (default all)")
+@click.option(
+    "--days", type=click.FloatRange(min=0, min_open=True), default=30.0, help="Look back this many days (default 30)"
+)
+@click.option(
+    "--percentile",
+    "percentiles",
+    type=click.FloatRange(0, 100),
+    multiple=True,
+    help="Latency percentile to report; repeat for several (default 50 and 95)",
+)
+@click.option(
+    "--history-db",
+    "history_db_path",
+    type=click.Path(dir_okay=False),
+    default=None,
+    help="Measurement history database (default history.sqlite in the per-user data directory)",
+)
+def history(
+    device_name, hostapi, samplerate, blocksize, input_channel, output_channel, days, percentiles, history_db_path
+):
+    """Summarize recorded latencies per configuration over the last days."""
+    path = history_db_path or os.path.join(get_data_dir(), "history.sqlite")
+    if not os.path.exists(path):
+        print(f"No measurement history at {path}. Record some with: latencycalc measure --history")
+        return
+    percentiles = percentiles or (50.0, 95.0)
+    try:
+        db = HistoryDB(path)
+    except (sqlite3.Error, OSError) as e:
+        print(f"Error opening measurement history: {e}")
+        return
+    try:
+        groups = db.latencies(
+            since=time.time() - days * 24 * 3600,
+            device_name=device_name,
+            hostapi=hostapi,
+            samplerate=samplerate,
+            blocksize=blocksize,
+            input_channel=input_channel,
+            output_channel=output_channel,
+        )
+    finally:
+        db.close()
+    if not groups:
+        print(f"No matching measurements in the last {days:g} days.")
+        return
+
+    print(f"Latency history over the last {days:g} days (ms):")
+    header = f"{'Device':<32} {'Host API':<12} {'Sample Rate':<12} {'Block Size':<11} {'In':<4} {'Out':<4} {'N':<7} {'Mean':<9}"
+    header += "".join(f" {f'p{p:g}':<9}" for p in percentiles)
+    print(header)
+    print("-" * len(header))
+    for (device, api, sr, bs, ic, oc), latencies in groups.items():
+        line = f"{device[:32]:<32} {api[:12]:<12} {sr:<12} {bs:<11} {ic:<4} {oc:<4} {len(latencies):<7} {np.mean(latencies):<9.3f}"
+        line += "".join(f" {value:<9.3f}" for value in np.percentile(latencies, percentiles))
+        print(line)
+
+
+@cli.command()
+@click.option("--port", type=click.IntRange(1, 65535), default=8765, help="Localhost HTTP port (default 8765)")
+@click.option(
+    "--socket", "socket_path", type=click.Path(dir_okay=False), default=None, help="Listen on this Unix socket instead"
+)
+def serve(port, socket_path):
+    """Keep the audio hardware warm and run measurement jobs sent over a local HTTP API."""
+    if socket_path is not None and sys.platform == "win32":
+        raise click.UsageError("--socket is not available on Windows, use --port")
+    import signal
+
+    service = MeasurementService()
+    server = make_job_server(service, port=port, socket_path=socket_path)
+    # Clean up on a service manager's SIGTERM as on Ctrl-C
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    print(f"Serving measurement jobs on {socket_path or f'http://127.0.0.1:{port}'} ({len(device_registry)} devices)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if socket_path is not None and os.path.exists(socket_path):
+            os.unlink(socket_path)
+
+
 if __name__ == "__main__":
     sys.exit(cli())
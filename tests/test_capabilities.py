@@ -0,0 +1,55 @@
+"""Check the block size edge search of get_capability_matrix against a stubbed driver."""
+
+import itertools
+
+import pytest
+
+import latencycalc
+from latencycalc import COMMON_BLOCKSIZES, get_capability_matrix
+
+
+def stub_driver(monkeypatch, ranges):
+    """Make probe_stream accept blocksizes within ranges[samplerate] = (min, max), and count the probes."""
+    probes = []
+
+    def probe_stream(device_id, samplerate, blocksize, input_channels=1, output_channels=1):
+        probes.append((samplerate, blocksize))
+        low, high = ranges.get(samplerate, (0, -1))
+        return low <= blocksize <= high
+
+    monkeypatch.setattr(latencycalc, "probe_stream", probe_stream)
+    return probes
+
+
+def expected_matrix(ranges):
+    return {
+        sr: [bs for bs in COMMON_BLOCKSIZES if low <= bs <= high]
+        for sr, (low, high) in ranges.items()
+        if any(low <= bs <= high for bs in COMMON_BLOCKSIZES)
+    }
+
+
+@pytest.mark.parametrize("low, high", list(itertools.combinations_with_replacement(COMMON_BLOCKSIZES, 2)))
+def test_every_contiguous_range(monkeypatch, low, high):
+    ranges = {48000: (low, high)}
+    stub_driver(monkeypatch, ranges)
+    assert get_capability_matrix(0, [48000]) == expected_matrix(ranges)
+
+
+def test_ranges_change_between_rates(monkeypatch):
+    ranges = {44100: (64, 2048), 48000: (32, 1024), 96000: (128, 512), 176400: (0, 0), 192000: (256, 2048)}
+    stub_driver(monkeypatch, ranges)
+    assert get_capability_matrix(0, sorted(ranges)) == expected_matrix(ranges)
+
+
+def test_unchanged_range_confirmed_with_four_probes(monkeypatch):
+    ranges = dict.fromkeys((44100, 48000, 96000), (64, 1024))
+    probes = stub_driver(monkeypatch, ranges)
+    assert get_capability_matrix(0, sorted(ranges)) == expected_matrix(ranges)
+    assert sum(sr == 96000 for sr, _ in probes) == 4
+
+
+def test_no_valid_blocksize(monkeypatch):
+    probes = stub_driver(monkeypatch, {})
+    assert get_capability_matrix(0, [44100, 48000]) == {}
+    assert len(probes) == 2 * len(COMMON_BLOCKSIZES)
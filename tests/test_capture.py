@@ -0,0 +1,59 @@
+"""Check the RingCapture limit and ring modes, and its status flag counting."""
+
+import types
+
+import numpy as np
+
+from latencycalc import RingCapture
+
+
+def blocks(frames, size, channels=2):
+    """Yield consecutive blocks whose samples hold their absolute frame number."""
+    ramp = np.repeat(np.arange(frames, dtype=np.float32)[:, np.newaxis], channels, axis=1)
+    for start in range(0, frames, size):
+        yield ramp[start : start + size]
+
+
+def test_limit_stops_and_sets_done():
+    capture = RingCapture(np.zeros((1000, 2), np.float32))
+    capture.limit = 700
+    stored = [capture.write(block) for block in blocks(1000, 128)]
+    assert stored == [128] * 5 + [60, 0, 0]
+    assert capture.done.is_set()
+    assert capture.frames == 700
+    assert np.array_equal(capture.buffer[:700, 0], np.arange(700))
+    assert not capture.buffer[700:].any()
+
+
+def test_limit_not_reached():
+    capture = RingCapture(np.zeros((1000, 1), np.float32))
+    for block in blocks(500, 100, channels=1):
+        capture.write(block)
+    assert not capture.done.is_set()
+    assert np.array_equal(capture.read(0, 500)[:, 0], np.arange(500))
+    assert capture.read(400, 200) is None
+
+
+def test_ring_wraps_and_keeps_the_latest_frames():
+    capture = RingCapture(np.zeros((1000, 2), np.float32), ring=True)
+    for block in blocks(2500, 96):
+        assert capture.write(block) == len(block)
+    assert capture.frames == 2500
+    assert not capture.done.is_set()
+    # Only the last capacity frames are held, including ranges across the wrap
+    assert np.array_equal(capture.read(1500, 1000)[:, 1], np.arange(1500, 2500))
+    assert np.array_equal(capture.read(1950, 100)[:, 0], np.arange(1950, 2050))
+    assert capture.read(1499, 10) is None
+    assert capture.read(2400, 101) is None
+
+
+def test_status_counts_and_xruns():
+    capture = RingCapture(np.zeros((10, 1), np.float32))
+    flags = [{"input_overflow"}, set(), {"output_underflow", "input_overflow"}, {"priming_output"}]
+    for names in flags:
+        status = types.SimpleNamespace(**{flag: flag in names for flag in RingCapture.STATUS_FLAGS})
+        capture.record_status(status if names else None)
+    assert capture.status_counts["input_overflow"] == 2
+    assert capture.status_counts["output_underflow"] == 1
+    assert capture.xruns == 3
+    assert capture.status_summary() == "input_overflow x2, output_underflow x1, priming_output x1"
@@ -0,0 +1,86 @@
+"""Check DeviceRegistry.select on a stubbed device list: substring and glob names, host APIs and fingerprints."""
+
+import types
+
+import pytest
+
+import latencycalc
+from latencycalc import DeviceRegistry
+
+HOSTAPIS = [{"name": "MME"}, {"name": "ASIO"}, {"name": "Windows WASAPI"}]
+DEVICES = [
+    ("Speakers (Realtek)", 0, 0, 2),
+    ("Focusrite USB ASIO", 1, 2, 2),
+    ("Focusrite USB", 0, 2, 2),
+    ("Focusrite USB", 2, 2, 2),
+    ("USB Audio CODEC", 0, 1, 1),
+    ("USB Audio CODEC", 0, 1, 1),  # A second identical unit shares the fingerprint
+]
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    devices = [
+        {"name": name, "hostapi": hostapi, "max_input_channels": inputs, "max_output_channels": outputs}
+        for name, hostapi, inputs, outputs in DEVICES
+    ]
+    stub = types.SimpleNamespace(query_devices=lambda: devices, query_hostapis=lambda: HOSTAPIS)
+    monkeypatch.setattr(latencycalc, "sd", stub)
+    return DeviceRegistry()
+
+
+def selected(registry, **selectors):
+    device, error = registry.select(**selectors)
+    assert error is None, error
+    return device["index"]
+
+
+def test_unique_substring_and_index(registry):
+    assert selected(registry, name="realtek") == 0
+    assert selected(registry, name="asio") == 1
+    assert selected(registry, device_id=2) == 2
+    assert selected(registry, device_id=2, name="focusrite") == 2
+
+
+def test_ambiguous_name_lists_every_match(registry):
+    device, error = registry.select(name="Focusrite")
+    assert device is None
+    assert error.startswith("3 devices match name 'Focusrite': ")
+    for index in (1, 2, 3):
+        assert f"{index}: " in error
+
+
+def test_hostapi_disambiguates(registry):
+    assert selected(registry, name="focusrite usb", hostapi="asio") == 1
+    assert selected(registry, name="focusrite usb", hostapi="windows wasapi") == 3
+    assert selected(registry, name="focusrite", hostapi="MME") == 2
+
+
+def test_glob_matches_whole_name(registry):
+    assert selected(registry, name="Focusrite USB ASI?") == 1
+    assert selected(registry, name="*realtek*") == 0
+    # A glob is anchored, unlike a plain substring
+    assert selected(registry, name="Focusrite*", hostapi="MME") == 2
+    device, error = registry.select(name="USB*")
+    assert device is None and error.startswith("2 devices match")
+    device, error = registry.select(name="[xyz]*")
+    assert device is None and error == "No device matches name '[xyz]*'"
+
+
+def test_fingerprint(registry):
+    focusrite = registry[1]["fingerprint"]
+    assert selected(registry, fingerprint=focusrite) == 1
+    # Identical units share a fingerprint, so it only selects one together with an index
+    codec = registry[4]["fingerprint"]
+    assert registry[5]["fingerprint"] == codec
+    _, error = registry.select(fingerprint=codec)
+    assert error.startswith("2 devices match fingerprint")
+    assert selected(registry, fingerprint=codec, device_id=5) == 5
+    _, error = registry.select(fingerprint=focusrite, device_id=5)
+    assert error == f"No device matches index 5, fingerprint {focusrite!r}"
+
+
+def test_no_match(registry):
+    assert registry.select(device_id=42) == (None, "No device matches index 42")
+    assert registry.select(name="Scarlett") == (None, "No device matches name 'Scarlett'")
+    assert registry.select(hostapi="CoreAudio") == (None, "No device matches host API 'CoreAudio'")
@@ -0,0 +1,85 @@
+"""Check sub-sample peak refinement on known fractional delays, and that noise is not taken for a peak."""
+
+import numpy as np
+import pytest
+
+from latencycalc import (
+    INTERPOLATION_METHODS,
+    MatchedFilter,
+    MeasurementError,
+    interpolation_bias,
+    refine_peak,
+    stimulus_code,
+)
+
+DELAYS = [100.0, 100.3, 100.5, 100.83, 137.125]
+
+
+def delayed(signal, delay, length):
+    """Return signal delayed by a fractional number of samples with a band-limited (FFT) shift."""
+    spectrum = np.fft.rfft(signal, length)
+    return np.fft.irfft(spectrum * np.exp(-2j * np.pi * np.fft.rfftfreq(length) * delay), length)
+
+
+@pytest.mark.parametrize("delay", DELAYS)
+def test_gaussian_exact_on_gaussian_peak(delay):
+    lags = np.arange(200)
+    correlation = np.exp(-0.5 * ((lags - delay) / 3.0) ** 2)
+    lag, _ = refine_peak(correlation, int(np.argmax(correlation)), "gaussian")
+    assert lag == pytest.approx(delay, abs=1e-9)
+
+
+@pytest.mark.parametrize("method", ["parabolic", "gaussian", "sinc"])
+@pytest.mark.parametrize("delay", DELAYS)
+def test_sinc_peak(method, delay):
+    # Band-limited impulse: the windowed sinc interpolant is much closer than the three-point fits
+    correlation = np.sinc(np.arange(200) - delay)
+    lag, _ = refine_peak(correlation, int(np.argmax(correlation)), method)
+    assert lag == pytest.approx(delay, abs=0.02 if method == "sinc" else 0.15)
+
+
+@pytest.mark.parametrize("kind", ["pulse", "mls", "golay", "sweep"])
+@pytest.mark.parametrize("method", ["parabolic", "gaussian", "sinc"])
+def test_error_within_uncertainty(kind, method):
+    # Without noise the uncertainty is the interpolation bias, the worst error over a grid of delays
+    samplerate, max_lag = 48000, 400
+    code, template = stimulus_code(kind, samplerate, max_lag)
+    matched_filter = MatchedFilter(template, max_lag)
+    bias = interpolation_bias(kind, samplerate, method)
+    for delay in DELAYS:
+        recorded = delayed(code, delay, len(code) + max_lag)
+        correlation = matched_filter.correlate(recorded)
+        if kind == "sweep":
+            correlation = np.abs(correlation)
+        lag, uncertainty = refine_peak(correlation, int(np.argmax(correlation)), method, bias)
+        assert abs(lag - delay) <= uncertainty + 1e-3
+        assert uncertainty < 0.2
+
+
+@pytest.mark.parametrize("method", INTERPOLATION_METHODS)
+def test_find_peak_rejects_noise(method):
+    max_lag = 400
+    code, template = stimulus_code("mls", 48000, max_lag)
+    noise = 0.1 * np.random.default_rng(1).standard_normal(len(code) + max_lag)
+    with pytest.raises(MeasurementError) as error:
+        MatchedFilter(template, max_lag).find_peak(noise, method)
+    assert error.value.code == "no_signal"
+
+
+def test_find_peak_accepts_noisy_signal():
+    max_lag = 400
+    code, template = stimulus_code("mls", 48000, max_lag)
+    noise = 0.5 * np.random.default_rng(2).standard_normal(len(code) + max_lag)
+    lag, _ = MatchedFilter(template, max_lag).find_peak(delayed(code, 100.3, len(code) + max_lag) + noise, "sinc")
+    assert lag == pytest.approx(100.3, abs=0.1)
+
+
+def test_find_peak_rejects_silence():
+    code, template = stimulus_code("pulse", 48000)
+    with pytest.raises(MeasurementError):
+        MatchedFilter(template, 400).find_peak(np.zeros(len(code) + 400))
+
+
+def test_edge_peak_is_not_refined():
+    correlation = np.linspace(1.0, 0.0, 50)
+    assert refine_peak(correlation, 0) == (0.0, 0.5)
@@ -0,0 +1,77 @@
+"""Round-trip results through ColumnarWriter and read_results, in both columnar formats."""
+
+import importlib.util
+import math
+import zipfile
+
+import numpy as np
+import pytest
+
+from latencycalc import RESULT_NAMES, ColumnarWriter, LatencyResult, MeasurementError, read_results
+
+NEEDS_PYARROW = pytest.mark.skipif(importlib.util.find_spec("pyarrow") is None, reason="needs pyarrow")
+FORMATS = ["npz", pytest.param("parquet", marks=NEEDS_PYARROW)]
+
+
+def make_results(samplerate):
+    ok = LatencyResult.create(
+        samplerate, 128, 0, 1, "mls", latency_ms=5.25, std_ms=0.01, uncertainty_ms=0.002, count=8, xruns=0
+    )
+    failed = LatencyResult.create(
+        samplerate, 256, 0, 1, "mls", error=MeasurementError("no_signal", "No stimulus found in the recording")
+    )
+    return [ok, failed]
+
+
+def assert_rows_equal(rows, results):
+    assert len(rows) == len(results)
+    for row, result in zip(rows, results):
+        for name, value in zip([*RESULT_NAMES, "message"], result):
+            if isinstance(value, float) and math.isnan(value):
+                assert np.isnan(row[name]), name
+            else:
+                assert row[name] == value, name
+
+
+@pytest.mark.parametrize("export_format", FORMATS)
+def test_round_trip(tmp_path, export_format):
+    path = str(tmp_path / f"latency_results-run1.{export_format}")
+    metadata = {"run_id": "run1", "device": "Loopback", "options": {"repeats": 8}}
+    writer = ColumnarWriter(path, metadata)
+    groups = [make_results(48000), make_results(96000)]
+    for results in groups:
+        writer.append(results)
+    writer.close()
+
+    rows, runs = read_results(path)
+    assert runs == {"run1": metadata}
+    assert_rows_equal(rows, groups[0] + groups[1])
+    assert set(rows["run_id"]) == {"run1"}
+
+
+def test_npz_readable_before_close(tmp_path):
+    path = str(tmp_path / "latency_results-run1.npz")
+    writer = ColumnarWriter(path, {"run_id": "run1"})
+    writer.append(make_results(44100))
+    rows, _ = read_results(path)
+    assert_rows_equal(rows, make_results(44100))
+
+
+@pytest.mark.parametrize("export_format", FORMATS)
+def test_directory_skips_unreadable_files(tmp_path, capsys, export_format):
+    for run_id, samplerate in (("run1", 44100), ("run2", 48000)):
+        writer = ColumnarWriter(str(tmp_path / f"latency_results-{run_id}.{export_format}"), {"run_id": run_id})
+        writer.append(make_results(samplerate))
+        writer.close()
+    (tmp_path / f"latency_results-broken.{export_format}").write_bytes(b"PAR1 truncated")
+    (tmp_path / "notes.txt").write_text("not a results file")
+
+    rows, runs = read_results(str(tmp_path))
+    assert sorted(runs) == ["run1", "run2"]
+    assert_rows_equal(rows, make_results(44100) + make_results(48000))
+    assert list(rows["run_id"]) == ["run1", "run1", "run2", "run2"]
+    assert "Skipping unreadable results file" in capsys.readouterr().out
+
+    # pyarrow's ArrowInvalid is a ValueError
+    with pytest.raises((zipfile.BadZipFile, ValueError)):
+        read_results(str(tmp_path / f"latency_results-broken.{export_format}"))
@@ -0,0 +1,46 @@
+"""Pin the built-in sequence generators, so MLS and Gold code stimuli cannot change silently."""
+
+import hashlib
+
+import numpy as np
+import pytest
+
+from latencycalc import gold_codes, max_len_seq, next_fast_len
+
+# sha256 of max_len_seq(order).tobytes(), recorded from scipy.signal.max_len_seq
+MLS_DIGESTS = {
+    3: "df938bca7ea7927cefa75247b008c502febb567df3e434063e1ff8d861154ef8",
+    7: "13001d623a11bdee16e11fc7007f3c1e19b002f265b62bd23f752cdc47965a29",
+    10: "e252b74126f25a7738ae4a4bfa7b8cace2c2b838c947a6e2a7750b2dfcbdba13",
+    15: "0872de418872ef7ddf4757ec5e29171b2441566e10b00b29944853127c8759c9",
+}
+GOLD_DIGEST = "13a2fc37a5e37686bef60204058253c3b29389b6ba70ec3544faf4e5d6c2b9a1"  # gold_codes(7, 4) > 0
+
+
+def test_max_len_seq_short():
+    assert max_len_seq(3).tolist() == [1, 1, 1, 0, 1, 0, 0]
+    assert max_len_seq(4).tolist() == [1, 1, 1, 1, 0, 1, 0, 1, 1, 0, 0, 1, 0, 0, 0]
+
+
+@pytest.mark.parametrize("order", sorted(MLS_DIGESTS))
+def test_max_len_seq_digest(order):
+    assert hashlib.sha256(max_len_seq(order).tobytes()).hexdigest() == MLS_DIGESTS[order]
+
+
+def test_gold_codes_digest():
+    assert hashlib.sha256((gold_codes(7, 4) > 0).tobytes()).hexdigest() == GOLD_DIGEST
+
+
+def test_next_fast_len():
+    assert [next_fast_len(n) for n in (1, 7, 11, 17, 97, 1000, 1025, 30001)] == [1, 8, 12, 18, 100, 1000, 1080, 30375]
+
+
+@pytest.mark.parametrize("order", range(2, 17))
+def test_max_len_seq_matches_scipy(order):
+    signal = pytest.importorskip("scipy.signal")
+    assert np.array_equal(max_len_seq(order), signal.max_len_seq(order)[0])
+
+
+def test_next_fast_len_matches_scipy():
+    fft = pytest.importorskip("scipy.fft")
+    assert all(next_fast_len(n) == fft.next_fast_len(n, real=True) for n in range(1, 5000))
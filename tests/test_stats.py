@@ -0,0 +1,79 @@
+"""Check the streaming statistics against numpy on the whole series."""
+
+import numpy as np
+import pytest
+
+from latencycalc import T_CRITICAL_95, P2Quantile, RunningStats
+
+SERIES = {
+    "normal": lambda rng, n: 5.0 + 0.1 * rng.standard_normal(n),
+    "uniform": lambda rng, n: rng.uniform(2.0, 3.0, n),
+    "skewed": lambda rng, n: 10.0 + rng.exponential(0.5, n),
+}
+
+
+@pytest.mark.parametrize("q", [0.05, 0.5, 0.95])
+@pytest.mark.parametrize("series", sorted(SERIES))
+def test_p2_quantile_close_to_numpy(series, q):
+    values = SERIES[series](np.random.default_rng(0), 5000)
+    sketch = P2Quantile(q)
+    for x in values:
+        sketch.add(x)
+    # The P-square markers settle within a small fraction of the spread
+    assert sketch.value() == pytest.approx(np.quantile(values, q), abs=0.02 * np.std(values))
+
+
+@pytest.mark.parametrize("n", [1, 2, 3, 4, 5])
+def test_p2_quantile_exact_for_few_samples(n):
+    values = [3.0, 1.0, 4.0, 1.5, 9.0][:n]
+    for q in (0.5, 0.95):
+        sketch = P2Quantile(q)
+        for x in values:
+            sketch.add(x)
+        if n < 5:
+            assert sketch.value() == pytest.approx(np.quantile(values, q))
+        else:
+            assert values[0] <= sketch.value() <= max(values)
+
+
+def test_p2_quantile_empty():
+    assert np.isnan(P2Quantile(0.5).value())
+
+
+@pytest.mark.parametrize("series", sorted(SERIES))
+def test_running_stats_matches_numpy(series):
+    values = SERIES[series](np.random.default_rng(1), 1000)
+    stats = RunningStats()
+    stats.extend(values)
+    assert stats.count == len(values)
+    assert stats.mean == pytest.approx(np.mean(values), rel=1e-12)
+    assert stats.variance == pytest.approx(np.var(values, ddof=1), rel=1e-9)
+    assert stats.std == pytest.approx(np.std(values, ddof=1), rel=1e-9)
+    assert (stats.min, stats.max) == (np.min(values), np.max(values))
+    assert stats.ci_halfwidth() == pytest.approx(1.96 * np.std(values, ddof=1) / np.sqrt(len(values)))
+
+
+def test_running_stats_large_offset():
+    # Welford's update keeps the variance of small jitter on a large latency
+    values = 1e6 + 1e-3 * np.random.default_rng(2).standard_normal(1000)
+    stats = RunningStats()
+    stats.extend(values)
+    assert stats.variance == pytest.approx(np.var(values, ddof=1), rel=1e-6)
+
+
+def test_running_stats_small_sample_ci():
+    values = [5.0, 5.2, 4.9, 5.1]
+    stats = RunningStats()
+    stats.extend(values)
+    expected = T_CRITICAL_95[len(values) - 2] * np.std(values, ddof=1) / np.sqrt(len(values))
+    assert stats.ci_halfwidth() == pytest.approx(expected)
+    assert stats.converged(2 * expected + 1e-9, min_samples=4)
+    assert not stats.converged(2 * expected - 1e-9, min_samples=4)
+    assert not stats.converged(1.0, min_samples=5)
+
+
+def test_running_stats_single_sample():
+    stats = RunningStats()
+    stats.add(7.0)
+    assert np.isnan(stats.variance) and np.isnan(stats.ci_halfwidth())
+    assert stats.result_fields() == {"latency_ms": 7.0, "count": 1}